@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tsp_branch_bound import Fragments  # noqa: E402
+
+
+def fragments(sublists):
+    tour = Fragments()
+    for sublist in sublists:
+        for k in range(len(sublist) - 1):
+            tour.add(sublist[k], sublist[k + 1])
+    return tour
+
+
+def add_path(possible_paths, current_tour):
+    tour = fragments(current_tour)
+    for i, j in possible_paths:
+        if tour.add(i, j):
+            break
+    return sorted(tour.sublists())
+
+
+class TestFragments(unittest.TestCase):
+
+    def test_add(self):
+        self.assertEqual(add_path([[1, 2]], []), [[1, 2]])
+        self.assertEqual(add_path([[5, 1]], [[1, 2]]), [[5, 1, 2]])
+        self.assertEqual(add_path([[4, 8]], [[3, 5, 1, 2]]),
+                         [[3, 5, 1, 2], [4, 8]])
+        self.assertEqual(add_path([[8, 3], [8, 6]], [[3, 5, 1, 2], [4, 8]]),
+                         [[4, 8, 3, 5, 1, 2]])
+        self.assertEqual(
+            add_path([[4, 8], [4, 6]], [[8, 3, 5], [2, 4], [6, 1]]),
+            [[2, 4, 8, 3, 5], [6, 1]])
+        self.assertEqual(
+            add_path([[8, 5], [1, 9]], [[5, 3, 6, 7], [1, 2, 4], [9, 8]]),
+            [[1, 2, 4], [9, 8, 5, 3, 6, 7]])
+        self.assertEqual(add_path([[8, 2]], [[3, 6, 8], [2, 1]]),
+                         [[3, 6, 8, 2, 1]])
+
+    def test_add_closing_cycle(self):
+        self.assertEqual(add_path([[3, 5], [4, 6]], [[5, 1, 3]]),
+                         [[4, 6], [5, 1, 3]])
+        self.assertEqual(add_path([[2, 4], [3, 1], [3, 4]], [[1, 3], [4, 2]]),
+                         [[1, 3, 4, 2]])
+
+    def test_joined_length(self):
+        tour = fragments([[4, 6, 2], [1, 5]])
+        self.assertEqual(tour.joined_length(2, 1), 5)
+        self.assertEqual(tour.joined_length(5, 4), 5)
+        self.assertEqual(tour.joined_length(2, 3), 4)
+        self.assertEqual(tour.joined_length(3, 7), 2)
+
+    def test_remove(self):
+        tour = fragments([[4, 6, 2, 7], [1, 5]])
+        copy = tour.copy()
+
+        tour.remove(6, 2)
+        self.assertEqual(sorted(tour.sublists()), [[1, 5], [2, 7], [4, 6]])
+        tour.remove(4, 6)
+        self.assertEqual(sorted(tour.sublists()), [[1, 5], [2, 7]])
+        self.assertTrue(tour.add(7, 4))
+        self.assertFalse(tour.add(4, 2))
+
+        self.assertEqual(sorted(copy.sublists()), [[1, 5], [4, 6, 2, 7]])
+
+
+if __name__ == '__main__':
+    unittest.main()
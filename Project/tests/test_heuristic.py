@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import itertools
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tsp_branch_bound import (  # noqa: E402
+    TSPSolver, heuristic_tour, improve_tour, or_opt, tour_cost, two_opt)
+
+
+def random_W(cities, seed):
+    random.seed(seed)
+    return [[0 if i == j else random.randint(1, 100) for j in range(cities)]
+            for i in range(cities)]
+
+
+def random_tour(cities, seed):
+    random.seed(seed)
+    tour = list(range(cities))
+    random.shuffle(tour)
+    return tour
+
+
+# every tour two_opt may change the tour to, in the order it tries them
+def two_opt_moves(tour):
+    n = len(tour)
+    for i in range(1, n - 1):
+        for j in range(i + 1, n):
+            yield tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+
+
+# every tour or_opt may change the tour to, in the order it tries them
+def or_opt_moves(tour):
+    n = len(tour)
+    for length in (1, 2, 3):
+        if n < length + 3:
+            break
+        for i in range(1, n - length + 1):
+            part = tour[i:i + length]
+            rest = tour[:i] + tour[i + length:]
+            for k in range(len(rest)):
+                if rest[k] != tour[i - 1]:
+                    yield rest[:k + 1] + part + rest[k + 1:]
+
+
+class TestHeuristic(unittest.TestCase):
+
+    # The change of the cost that two_opt or or_opt computes
+    # for a move is its real change (which, as the matrix is
+    # not symmetric, includes the reversed paths for two_opt):
+    # the tour is changed by the first move that makes it
+    # shorter, or not at all if none does.
+    def check_local_search(self, improve, moves):
+        for seed in range(1, 21):
+            n = 3 + seed % 8
+            W = random_W(n, seed)
+            tour = random_tour(n, seed)
+            old_cost = tour_cost(W, tour)
+
+            better = [new_tour for new_tour in moves(tour)
+                      if tour_cost(W, new_tour) < old_cost]
+
+            new_tour = tour.copy()
+            changed = improve(W, new_tour)
+
+            self.assertEqual(sorted(new_tour), list(range(n)))
+            self.assertEqual(changed, bool(better))
+            self.assertEqual(new_tour, better[0] if better else tour)
+
+    def test_two_opt(self):
+        self.check_local_search(two_opt, two_opt_moves)
+
+    def test_or_opt(self):
+        self.check_local_search(or_opt, or_opt_moves)
+
+    def test_improve_tour(self):
+        for seed in range(1, 6):
+            W = random_W(12, seed)
+            tour = random_tour(12, seed)
+            old_cost = tour_cost(W, tour)
+
+            improve_tour(W, tour)
+
+            self.assertEqual(sorted(tour), list(range(12)))
+            self.assertLessEqual(tour_cost(W, tour), old_cost)
+            self.assertFalse(two_opt(W, tour))
+            self.assertFalse(or_opt(W, tour))
+
+    def test_heuristic_tour(self):
+        for seed in range(1, 6):
+            W = random_W(7, seed)
+            C = [[None if i == j else W[i][j] for j in range(7)]
+                 for i in range(7)]
+
+            tour, cost = heuristic_tour(C)
+
+            self.assertEqual(sorted(tour), list(range(1, 8)))
+            self.assertEqual(
+                cost, sum(C[tour[k] - 1][tour[(k + 1) % 7] - 1]
+                          for k in range(7)))
+            self.assertGreaterEqual(
+                cost, min(tour_cost(W, (0,) + rest)
+                          for rest in itertools.permutations(range(1, 7))))
+
+        # a missing path
+        C = [[None, 1, 1], [1, None, None], [1, None, None]]
+        self.assertEqual(heuristic_tour(C), (None, None))
+
+    def test_use_heuristic(self):
+        self.assertFalse(TSPSolver().use_heuristic())
+        self.assertTrue(TSPSolver(heuristic=True).use_heuristic())
+        for limit in ['time_limit', 'node_limit', 'gap']:
+            self.assertTrue(TSPSolver(**{limit: 1}).use_heuristic())
+            self.assertFalse(
+                TSPSolver(heuristic=False, **{limit: 1}).use_heuristic())
+
+
+if __name__ == '__main__':
+    unittest.main()
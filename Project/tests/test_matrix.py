@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tsp_branch_bound import (  # noqa: E402
+    INF, TSPSolver, copy_matrix, find_Dij, generate_new_matrix, ind,
+    is_array, min_no_element, np, simplify)
+
+ENGINES = ['list'] if np is None else ['list', 'numpy']
+
+
+# the active part of the matrix as lists (None meaning INF)
+def active(M, rows, cols):
+    if is_array(M):
+        M = [[None if x == INF else x for x in row] for row in M.tolist()]
+    return [[M[ind(i)][ind(j)] for j in cols] for i in rows]
+
+
+# D[i,j] the way it was found before the minimums of the
+# rows and columns were cached
+def find_Dij_by_definition(M, rows, cols):
+    M_active = active(M, rows, cols)
+    M_T = [list(col) for col in zip(*M_active)]
+
+    return [[min_no_element(row, b) + min_no_element(M_T[b], a),
+             rows[a], cols[b]]
+            for a, row in enumerate(M_active)
+            for b, el in enumerate(row) if el == 0]
+
+
+def random_matrices():
+    for seed in range(1, 6):
+        random.seed(seed)
+        C = generate_new_matrix(12, [1, 30])
+        yield C
+        # with missing paths
+        yield [[x if random.random() < 0.6 else 0 for x in row] for row in C]
+
+
+class TestMatrix(unittest.TestCase):
+
+    # Delete rows and columns and disable paths at random,
+    # like blocks 5 and 11 do. After every change, the
+    # incremental simplification must give the same matrix
+    # and the same sum of subtrahends as simplifying the
+    # whole matrix, and D[i,j] must be the same as by its
+    # definition.
+    def test_incremental_simplify(self):
+        for engine in ENGINES:
+            for C in random_matrices():
+                solver = TSPSolver(engine=engine, heuristic=False,
+                                   preprocessing=False, dp_threshold=0)
+                solver.start(C)
+                self.assertEqual(is_array(solver.C_prime), engine == 'numpy')
+
+                while len(solver.row_map) > 2:
+                    i = random.choice(solver.row_map)
+                    j = random.choice(solver.col_map)
+                    if random.random() < 0.5:
+                        solver.disable_path(i, j)
+                    else:
+                        solver.delete_row_col(i, j)
+
+                    rows, cols = solver.row_map[:], solver.col_map[:]
+                    M, sum_subtrahends = simplify(
+                        copy_matrix(solver.C_prime), rows, cols)
+
+                    self.assertEqual(
+                        solver.simplify_C_prime(incremental=True),
+                        sum_subtrahends)
+                    self.assertEqual(active(solver.C_prime, rows, cols),
+                                     active(M, rows, cols))
+
+                    self.assertEqual(
+                        sorted(find_Dij(solver.C_prime, rows, cols)),
+                        sorted(find_Dij_by_definition(
+                            solver.C_prime, rows, cols)))
+
+
+if __name__ == '__main__':
+    unittest.main()
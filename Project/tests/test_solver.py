@@ -0,0 +1,631 @@
+#!/usr/bin/env python
+
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tsp_branch_bound import (  # noqa: E402
+    DP_MAX_CITIES, SUBTREE_MIN_ITERATIONS, CandidateNodes, Node, Snapshot,
+    SnapshotStore, TSPSolver, do_test_run, dp_tour, find_Dij,
+    generate_new_matrix, init_worker, node_paths, np, read_checkpoint,
+    solve_parallel, solve_subproblem, summarize_test_runs)
+
+
+def brute_force_cost(C):
+    n = len(C)
+    costs = []
+    for rest in itertools.permutations(range(1, n)):
+        tour = (0,) + rest
+        paths = [C[tour[k]][tour[(k + 1) % n]] for k in range(n)]
+        if 0 not in paths:
+            costs.append(sum(paths))
+    return min(costs)
+
+
+def random_matrix(cities, seed, symmetric=False):
+    random.seed(seed)
+    return generate_new_matrix(cities, [1, 100], symmetric=symmetric)
+
+
+class TestSolver(unittest.TestCase):
+
+    def test_small_matrix(self):
+        C = [[0, 7, 1, 5, 9, 8],
+             [7, 0, 8, 6, 10, 4],
+             [9, 3, 0, 3, 2, 10],
+             [5, 9, 10, 0, 5, 2],
+             [2, 6, 8, 9, 0, 6],
+             [7, 6, 10, 0, 9, 0]]
+
+        tour, cost, stats = TSPSolver(dp_threshold=0).solve(C)
+
+        self.assertEqual(cost, brute_force_cost(C))
+        self.assertEqual(sorted(tour), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(tour[0], 1)
+        self.assertEqual(
+            cost, sum(C[tour[k] - 1][tour[(k + 1) % 6] - 1] for k in range(6)))
+        # the input matrix is not changed
+        self.assertEqual(C[0], [0, 7, 1, 5, 9, 8])
+
+    def test_random_matrices(self):
+        for seed in range(1, 6):
+            C = random_matrix(8, seed)
+            self.assertEqual(TSPSolver(dp_threshold=0).solve(C)[1],
+                             brute_force_cost(C))
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_numpy_engine(self):
+        matrices = [(random_matrix(25, seed), bound)
+                    for seed in range(1, 4)
+                    for bound in ['reduction', 'assignment']]
+        matrices += [(random_matrix(20, seed, symmetric=True), 'one_tree')
+                     for seed in range(1, 3)]
+        # with missing paths (INF in the array)
+        for seed in range(1, 3):
+            C = random_matrix(20, seed)
+            matrices.append(([[x if random.random() < 0.5 else 0 for x in row]
+                              for row in C], 'reduction'))
+
+        for C, bound in matrices:
+            results = []
+            for engine in ['list', 'numpy']:
+                solver = TSPSolver(engine=engine, bound=bound,
+                                   preprocessing=False, dp_threshold=0)
+                results.append(solver.solve(C))
+                self.assertEqual(solver.C_array is not None,
+                                 engine == 'numpy')
+
+            (tour, cost, stats), (np_tour, np_cost, np_stats) = results
+            self.assertEqual((np_tour, np_cost), (tour, cost))
+            self.assertEqual(np_stats['iterations'], stats['iterations'])
+
+    def test_assignment_bound(self):
+        for seed in range(1, 6):
+            C = random_matrix(8, seed)
+            tour, cost, stats = TSPSolver(
+                bound='assignment', dp_threshold=0).solve(C)
+            self.assertEqual(cost, brute_force_cost(C))
+            self.assertEqual(sorted(tour), list(range(1, 9)))
+
+        for seed in range(1, 4):
+            C = random_matrix(25, seed)
+            self.assertEqual(TSPSolver(bound='assignment').solve(C)[1],
+                             TSPSolver().solve(C)[1])
+
+    def test_one_tree_bound(self):
+        for seed in range(1, 6):
+            C = random_matrix(8, seed, symmetric=True)
+            tour, cost, stats = TSPSolver(
+                bound='one_tree', dp_threshold=0).solve(C)
+            self.assertEqual(cost, brute_force_cost(C))
+            self.assertEqual(sorted(tour), list(range(1, 9)))
+
+        for seed in range(1, 4):
+            C = random_matrix(20, seed, symmetric=True)
+            self.assertEqual(
+                TSPSolver(bound='one_tree', snapshot_depth=2).solve(C)[1],
+                TSPSolver().solve(C)[1])
+
+    def test_dp(self):
+        for seed in range(1, 6):
+            C = random_matrix(8, seed)
+            tour, cost, stats = TSPSolver().solve(C)
+            self.assertEqual(cost, brute_force_cost(C))
+            self.assertEqual(sorted(tour), list(range(1, 9)))
+            self.assertEqual(tour[0], 1)
+            self.assertEqual(
+                cost, sum(C[tour[k] - 1][tour[(k + 1) % 8] - 1]
+                          for k in range(8)))
+            # nothing is branched
+            self.assertEqual((stats['method'], stats['iterations']),
+                             ('dp', 0))
+
+        for seed in range(1, 4):
+            C = random_matrix(12, seed)
+            self.assertEqual(TSPSolver(dp_threshold=12).solve(C)[1],
+                             TSPSolver(dp_threshold=0).solve(C)[1])
+            self.assertEqual(
+                TSPSolver(dp_threshold=0).solve(C)[2]['method'],
+                'branch_and_bound')
+
+        # test runs solved by dynamic programming are left
+        # out of the time per iteration
+        all_stats = [do_test_run(test_run, 1, 12, [1, 10], None, False,
+                                 {'dp_threshold': 12})
+                     for test_run in range(1, 4)]
+        self.assertEqual([stats['method'] for stats in all_stats],
+                         ['dp', 'dp', 'dp'])
+        summary = summarize_test_runs(all_stats)
+        self.assertEqual(summary['dp_runs'], 3)
+        self.assertEqual(summary['iterations'], 0)
+        self.assertEqual(summary['time_per_iteration'], 0)
+
+        # no tour
+        C = [[0, 1, 1], [1, 0, 0], [1, 0, 0]]
+        self.assertEqual(TSPSolver().solve(C)[:2], ([], None))
+
+        # larger matrices are never solved by dynamic programming
+        C = random_matrix(DP_MAX_CITIES + 1, 1)
+        tour, cost, stats = TSPSolver(dp_threshold=30).solve(C)
+        self.assertEqual(stats['method'], 'branch_and_bound')
+        self.assertEqual(cost, TSPSolver().solve(C)[1])
+        with self.assertRaises(AssertionError):
+            dp_tour([[x or None for x in row] for row in C])
+
+    def test_preprocessing(self):
+        for seed in range(1, 11):
+            # about 3 paths out of every city
+            C = [[x if random.random() < 0.4 else 0 for x in row]
+                 for row in random_matrix(9, seed)]
+            expected = dp_tour([[x or None for x in row] for row in C])
+
+            for preprocessing in [True, False]:
+                tour, cost, stats = TSPSolver(
+                    preprocessing=preprocessing, dp_threshold=0).solve(C)
+                self.assertEqual(cost, expected[1])
+                if cost is not None:
+                    self.assertEqual(sorted(tour), list(range(1, 10)))
+                    self.assertEqual(
+                        cost, sum(C[tour[k] - 1][tour[(k + 1) % 9] - 1]
+                                  for k in range(9)))
+
+        # every path is forced
+        C = [[0, 3, 0, 0], [0, 0, 5, 0], [0, 0, 0, 2], [4, 0, 0, 0]]
+        tour, cost, stats = TSPSolver(dp_threshold=0).solve(C)
+        self.assertEqual((tour, cost), ([1, 2, 3, 4], 14))
+        self.assertEqual(stats['iterations'], 0)
+
+        # 1 city, by branch and bound and by dynamic programming
+        for dp_threshold in [0, DP_MAX_CITIES]:
+            self.assertEqual(
+                TSPSolver(dp_threshold=dp_threshold).solve([[0]])[:2],
+                ([1], 0))
+        self.assertEqual(dp_tour([[None]]), ([1], 0))
+
+        # 2 cities
+        self.assertEqual(TSPSolver(dp_threshold=0).solve([[0, 1], [2, 0]])[:2],
+                         ([1, 2], 3))
+        self.assertEqual(TSPSolver(dp_threshold=0).solve([[0, 1], [0, 0]])[:2],
+                         ([], None))
+
+        # test runs which preprocessing solves without branching
+        all_stats = [do_test_run(test_run, 1, 15, [1, 10], 15, False, {})
+                     for test_run in range(1, 4)]
+        self.assertEqual([stats['iterations'] for stats in all_stats],
+                         [0, 0, 0])
+        summary = summarize_test_runs(all_stats)
+        self.assertEqual(summary['iterations'], 0)
+        self.assertEqual(summary['time_per_iteration'], 0)
+
+        # mixed with runs solved by dynamic programming and a run
+        # that branched
+        dp_stats = [do_test_run(test_run, 1, 12, [1, 10], None, False,
+                                {'dp_threshold': 12})
+                    for test_run in range(1, 4)]
+        stats = do_test_run(1, 1, 15, [1, 10], None, False, {})
+        summary = summarize_test_runs(all_stats + dp_stats + [stats])
+        self.assertEqual(summary['iterations'], stats['iterations'] / 7)
+        self.assertEqual(summary['time_per_iteration'],
+                         stats['time'] / stats['iterations'])
+        self.assertEqual(summary['dp_runs'], 3)
+
+    def test_limits(self):
+        C = random_matrix(30, 1)
+        tour, cost, stats = TSPSolver().solve(C)
+        self.assertIsNone(stats['stopped_by'])
+        self.assertEqual(stats['lower_bound'], cost)
+        self.assertEqual(stats['gap'], 0)
+
+        tour, cost, stats = TSPSolver(node_limit=5).solve(C)
+        self.assertEqual(stats['stopped_by'], 'node_limit')
+        self.assertEqual(stats['iterations'], 5)
+        self.assertLessEqual(stats['lower_bound'], cost)
+
+        tour, cost, stats = TSPSolver(
+            heuristic=False, node_limit=1).solve(C)
+        self.assertEqual((tour, cost), ([], None))
+        self.assertIsNotNone(stats['lower_bound'])
+        self.assertIsNone(stats['gap'])
+
+        tour, cost, stats = TSPSolver(gap=0.5).solve(C)
+        self.assertIn(stats['stopped_by'], [None, 'gap'])
+        self.assertLessEqual(cost, 1.5 * stats['lower_bound'])
+        self.assertLessEqual(stats['gap'], 0.5)
+
+        tour, cost, stats = TSPSolver(time_limit=1e-9).solve(C)
+        self.assertEqual(stats['stopped_by'], 'time_limit')
+        self.assertEqual(stats['iterations'], 0)
+
+        # test runs stopped before the first iteration
+        all_stats = [do_test_run(test_run, 1, 20, [1, 10], None, False,
+                                 {'time_limit': 1e-9})
+                     for test_run in range(1, 3)]
+        summary = summarize_test_runs(all_stats)
+        self.assertEqual(summary['stopped_runs'], 2)
+        self.assertEqual(summary['iterations'], 0)
+        self.assertEqual(summary['time_per_iteration'], 0)
+
+    def test_parallel_gap(self):
+        stopped_runs = 0
+        for seed in range(1, 7):
+            C = random_matrix(20, seed)
+            expected = TSPSolver().solve(C)[1]
+            for strategy in ['depth_first', 'best_first']:
+                tour, cost, stats = solve_parallel(
+                    C, 4, {'strategy': strategy, 'gap': 0.05,
+                           'dp_threshold': 0})
+                self.assertIn(stats['stopped_by'], [None, 'gap'])
+                self.assertLessEqual(stats['lower_bound'], expected)
+                if stats['stopped_by'] == 'gap':
+                    stopped_runs += 1
+                    self.assertLessEqual(stats['gap'], 0.05)
+                    self.assertLessEqual(cost, 1.05 * stats['lower_bound'])
+        self.assertGreater(stopped_runs, 0)
+
+        # a small gap, which is easy to overshoot
+        random.seed(6)
+        C = generate_new_matrix(25, [1, 10])
+        for _ in range(4):
+            tour, cost, stats = solve_parallel(
+                C, 4, {'strategy': 'depth_first', 'gap': 0.02,
+                       'dp_threshold': 0})
+            if stats['stopped_by'] == 'gap':
+                self.assertLessEqual(stats['gap'], 0.02)
+
+        # the processes do not stop on the gap of their own subtree
+        solver = TSPSolver(dp_threshold=0)
+        solver.start(C)
+        solver.search(max_open=4)
+        init_worker(C, {'gap': 0.5, 'dp_threshold': 0}, None, None, None,
+                    None, None)
+        stats = solve_subproblem(node_paths(solver.X))[2]
+        self.assertIsNone(stats['stopped_by'])
+
+    def test_node(self):
+        root = Node(None, (None, None), bound=0)
+        self.assertEqual(root.path, (None, None))
+
+        for path in [(1, 2), (-1, -2), (120, 7), (-7, -120)]:
+            node = Node(root, path)
+            self.assertEqual(node.path, path)
+            self.assertEqual(node.depth, 1)
+
+        # there is no room for anything else
+        with self.assertRaises(AttributeError):
+            root.left_child = node
+
+    def test_strategies(self):
+        for seed in range(1, 4):
+            C = random_matrix(25, seed)
+            expected = TSPSolver().solve(C)
+
+            for strategy in ['best_first_depth', 'depth_first', 'hybrid']:
+                tour, cost, stats = TSPSolver(
+                    strategy=strategy, queue_limit=5).solve(C)
+                self.assertEqual(cost, expected[1])
+                self.assertEqual(sorted(tour), list(range(1, 26)))
+                self.assertGreater(stats['peak_queue'], 0)
+
+            # without a tour to start from, depth first finds one
+            # sooner and keeps fewer candidate nodes
+            stats = [TSPSolver(strategy=strategy, heuristic=False).solve(C)[2]
+                     for strategy in ['best_first', 'depth_first']]
+            self.assertLessEqual(stats[1]['peak_queue'],
+                                 stats[0]['peak_queue'])
+
+    def test_branching(self):
+        for seed in range(1, 4):
+            C = random_matrix(20, seed)
+            expected = TSPSolver().solve(C)[1]
+
+            for branching in ['cost', 'fragment', 'strong']:
+                tour, cost, stats = TSPSolver(
+                    branching=branching, dp_threshold=0).solve(C)
+                self.assertEqual(cost, expected)
+                self.assertEqual(sorted(tour), list(range(1, 21)))
+
+            self.assertEqual(TSPSolver(
+                branching='strong', bound='assignment').solve(C)[1], expected)
+
+    def test_choose_path(self):
+        C = random_matrix(8, 1)
+        C[0][1], C[3][4] = 50, 20
+
+        # paths with the same D[i,j], with fragment 5 -> 6 -> 7
+        # in the tour: 1 -> 2 is dearer, 4 -> 5 joins 4 cities
+        possible_paths = [(1, 2), (4, 5)]
+        chosen = {}
+        for branching in ['first', 'cost', 'fragment']:
+            solver = TSPSolver(branching=branching, heuristic=False,
+                               dp_threshold=0)
+            solver.start(C)
+            solver.current_tour.add(5, 6)
+            solver.current_tour.add(6, 7)
+            chosen[branching] = solver.choose_path(possible_paths)
+        self.assertEqual(chosen, {'first': (1, 2), 'cost': (4, 5),
+                                  'fragment': (4, 5)})
+
+        solver = TSPSolver(branching='fragment', heuristic=False,
+                           dp_threshold=0)
+        solver.start(C)
+        solver.current_tour.add(2, 3)
+        solver.current_tour.add(3, 8)
+        self.assertEqual(solver.choose_path(possible_paths), (1, 2))
+
+        # strong branching leaves the matrix as it was and sets
+        # max_Dij to D[i,j] of the chosen path
+        for seed in range(1, 4):
+            solver = TSPSolver(branching='strong', heuristic=False,
+                               dp_threshold=0)
+            solver.start(random_matrix(12, seed))
+            C_prime = [row[:] for row in solver.C_prime]
+            D = {(i, j): D_ij for D_ij, i, j in
+                 find_Dij(solver.C_prime, solver.row_map, solver.col_map)}
+
+            max_D = max(D.values())
+            i, j = solver.choose_path(
+                [path for path in D if D[path] == max_D])
+            self.assertEqual(solver.max_Dij, D[i, j])
+            self.assertEqual(solver.C_prime, C_prime)
+            self.assertEqual(len(solver.current_tour), 0)
+
+    def test_transpositions(self):
+        # fragments 2 -> 1 -> 4 and 3 -> 5 (cost 11) have the
+        # same state as 2 -> 4 and 3 -> 1 -> 5 (cost 10) found
+        # before them
+        C = [[0, 7, 8, 3, 6],
+             [1, 0, 1, 2, 7],
+             [2, 9, 0, 8, 7],
+             [3, 7, 7, 0, 9],
+             [3, 5, 2, 9, 0]]
+        for strategy in ['best_first', 'depth_first']:
+            tour, cost, stats = TSPSolver(
+                transpositions=True, heuristic=False, strategy=strategy,
+                dp_threshold=0).solve(C)
+            self.assertEqual(cost, brute_force_cost(C))
+            self.assertEqual(sorted(tour), [1, 2, 3, 4, 5])
+            self.assertGreater(stats['transpositions'], 0)
+
+        for seed in range(1, 6):
+            C = random_matrix(8, seed)
+            self.assertEqual(TSPSolver(
+                transpositions=True, dp_threshold=0).solve(C)[1],
+                brute_force_cost(C))
+
+        for seed in range(1, 4):
+            random.seed(seed)
+            C = generate_new_matrix(25, [1, 5])
+            for strategy in ['best_first', 'depth_first']:
+                self.assertEqual(
+                    TSPSolver(transpositions=True, heuristic=False,
+                              strategy=strategy).solve(C)[1],
+                    TSPSolver().solve(C)[1])
+
+    def test_snapshot_store(self):
+        root = Node(None, (None, None), bound=0)
+        nodes = [Node(root, (1, 2), bound=bound) for bound in [5, 9, 3]]
+        snapshots = [Snapshot(0, [[None, 1], [1, None]], [1, 2], [1, 2],
+                              None, set(), set()) for _ in nodes]
+
+        # room for 2 snapshots, the one of the node with
+        # the highest bound is dropped
+        store = SnapshotStore(2 * snapshots[0].size)
+        for node, snapshot in zip(nodes, snapshots):
+            store.add(node, snapshot)
+        self.assertEqual([node.snapshot for node in nodes],
+                         [snapshots[0], None, snapshots[2]])
+        self.assertEqual(store.used, 2 * snapshots[0].size)
+
+        self.assertIs(store.take(nodes[0]), snapshots[0])
+        self.assertIsNone(nodes[0].snapshot)
+        self.assertIsNone(store.take(nodes[1]))
+        self.assertEqual((store.used, store.count), (snapshots[0].size, 1))
+
+    def test_snapshot_memory(self):
+        # the matrices of 12 cities fit into 3000 bytes one
+        # at a time
+        for cities, budget in [(12, 3000), (25, 2 ** 22)]:
+            saved = evicted = 0
+
+            for seed in range(1, 4):
+                C = random_matrix(cities, seed)
+                expected = TSPSolver(dp_threshold=0).solve(C)
+
+                solver = TSPSolver(snapshot_memory=budget, dp_threshold=0)
+                solver.start(C)
+                snapshots = solver.snapshots
+                add = snapshots.add
+
+                def add_within_budget(node, snapshot):
+                    nonlocal saved, evicted
+                    count = snapshots.count
+                    add(node, snapshot)
+                    if node.snapshot is not None:
+                        saved += 1
+                        count += 1
+                    evicted += count - snapshots.count
+                    self.assertLessEqual(snapshots.used, budget)
+
+                snapshots.add = add_within_budget
+                solver.search()
+                tour, cost, stats = solver.result()
+
+                self.assertEqual(cost, expected[1])
+                self.assertEqual(sorted(tour), list(range(1, cities + 1)))
+                self.assertLessEqual(snapshots.used, budget)
+
+            self.assertGreater(saved, 0)
+            if budget == 3000:
+                self.assertGreater(evicted, 0)
+            else:
+                self.assertEqual(evicted, 0)
+
+    def test_pruning(self):
+        root = Node(None, (None, None), bound=0)
+        candidate_nodes = CandidateNodes()
+        for bound in [5, 9, 3, 7, 9, 1]:
+            candidate_nodes.add(Node(root, (1, 2), bound=bound))
+
+        pruned = candidate_nodes.prune(7)
+        self.assertEqual(sorted(node.bound for node in pruned), [7, 9, 9])
+        self.assertEqual(candidate_nodes.size, 3)
+        self.assertEqual([candidate_nodes.pop().bound for _ in range(3)],
+                         [1, 3, 5])
+
+        C = random_matrix(30, 2)
+        expected = TSPSolver().solve(C)
+        tour, cost, stats = TSPSolver(
+            heuristic=False, strategy='depth_first').solve(C)
+        self.assertEqual(cost, expected[1])
+        self.assertGreater(stats['pruned'], 0)
+
+    def test_checkpoint(self):
+        C = random_matrix(30, 1)
+        expected = TSPSolver().solve(C)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'checkpoint.json')
+
+            tour, cost, stats = TSPSolver(
+                node_limit=20, checkpoint_file=file_name).solve(C)
+            self.assertEqual(stats['stopped_by'], 'node_limit')
+
+            checkpoint = read_checkpoint(file_name)
+            self.assertEqual(checkpoint['iterations'], 20)
+            self.assertEqual(checkpoint['best_cost'], cost)
+            self.assertTrue(checkpoint['open'])
+
+            solver = TSPSolver(checkpoint_file=file_name)
+            self.assertTrue(solver.resume(checkpoint))
+            self.assertTrue(solver.search())
+            tour, cost, stats = solver.result()
+            self.assertEqual(cost, expected[1])
+            self.assertEqual(sorted(tour), list(range(1, 31)))
+            self.assertGreater(stats['iterations'], 20)
+
+            # the search has finished, nothing is left to resume
+            checkpoint = read_checkpoint(file_name)
+            self.assertEqual(checkpoint['open'], [])
+            solver = TSPSolver()
+            self.assertFalse(solver.resume(checkpoint))
+            self.assertEqual(solver.result()[1], expected[1])
+
+            # small matrices and the ones solved by preprocessing
+            # are saved as finished too
+            for C in [random_matrix(8, 1),
+                      [[0, 3, 0, 0], [0, 0, 5, 0],
+                       [0, 0, 0, 2], [4, 0, 0, 0]]]:
+                os.remove(file_name)
+                expected = TSPSolver().solve(C)
+                self.assertEqual(
+                    TSPSolver(checkpoint_file=file_name).solve(C)[:2],
+                    expected[:2])
+
+                checkpoint = read_checkpoint(file_name)
+                self.assertEqual(checkpoint['open'], [])
+                solver = TSPSolver()
+                self.assertFalse(solver.resume(checkpoint))
+                self.assertEqual(solver.result()[:2], expected[:2])
+
+    def test_solver_is_reused(self):
+        matrices = [random_matrix(12, seed) for seed in range(1, 4)]
+        expected = [TSPSolver().solve(C)[:2] for C in matrices]
+
+        solver = TSPSolver()
+        for C, result in zip(matrices, expected):
+            self.assertEqual(solver.solve(C)[:2], result)
+
+    def test_solvers_side_by_side(self):
+        matrices = [random_matrix(15, seed) for seed in range(1, 5)]
+        expected = [TSPSolver().solve(C)[:2] for C in matrices]
+        results = [None] * len(matrices)
+
+        def solve(k):
+            results[k] = TSPSolver(snapshot_depth=2).solve(matrices[k])[:2]
+
+        threads = [threading.Thread(target=solve, args=(k,))
+                   for k in range(len(matrices))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([cost for _, cost in results],
+                         [cost for _, cost in expected])
+
+    def test_parallel(self):
+        for seed in range(1, 4):
+            C = random_matrix(20, seed)
+            tour, cost, stats = solve_parallel(C, 2, {})
+
+            self.assertEqual(cost, TSPSolver().solve(C)[1])
+            self.assertEqual(sorted(tour), list(range(1, 21)))
+
+        for strategy in ['depth_first', 'best_first']:
+            tour, cost, stats = solve_parallel(C, 2, {'strategy': strategy})
+            self.assertEqual(cost, TSPSolver().solve(C)[1])
+
+    def test_restart(self):
+        for seed in range(1, 4):
+            C = random_matrix(25, seed)
+            solver = TSPSolver(dp_threshold=0)
+            solver.start(C)
+            solver.search(max_open=8)
+
+            # the vertices are rebuilt from the saved root, with
+            # bounds at least as high as they were found with
+            restarted = TSPSolver(dp_threshold=0)
+            restarted.start(C)
+            restarted.save_root()
+            for node in solver.open_nodes():
+                restarted.restart(node_paths(node))
+                self.assertGreaterEqual(restarted.X.bound, node.bound)
+                self.assertEqual(restarted.iterations, 0)
+
+            # a search does not change the saved root
+            expected = TSPSolver(dp_threshold=0).solve(C)[1]
+            results = []
+            for _ in range(2):
+                restarted.restart([])
+                restarted.search()
+                results.append(restarted.result())
+                self.assertEqual(results[-1][1], expected)
+            self.assertEqual(results[0][2]['iterations'],
+                             results[1][2]['iterations'])
+
+    def test_parallel_hand_back(self):
+        C = random_matrix(20, 1)
+        solver = TSPSolver(dp_threshold=0)
+        solver.start(C)
+        solver.search(max_open=4)
+
+        # a more promising vertex is waiting already, the
+        # subtree is handed back after the minimum iterations
+        shared_lowest_bound = multiprocessing.Value('d', solver.X.bound - 1)
+        init_worker(C, {'dp_threshold': 0}, None, None, shared_lowest_bound,
+                    None, None)
+        paths = node_paths(solver.X)
+        tour, cost, stats, open_nodes = solve_subproblem(paths)
+        self.assertEqual(stats['iterations'], SUBTREE_MIN_ITERATIONS)
+        self.assertIsNone(stats['stopped_by'])
+        self.assertTrue(open_nodes)
+        for node_paths_, bound in open_nodes:
+            self.assertEqual(node_paths_[:len(paths)], paths)
+            self.assertGreaterEqual(bound, solver.X.bound)
+
+        # nothing is waiting
+        shared_lowest_bound.value = float('inf')
+        tour, cost, stats, open_nodes = solve_subproblem(
+            node_paths(solver.X))
+        self.assertEqual(open_nodes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
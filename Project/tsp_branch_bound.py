@@ -1,108 +1,340 @@
 #!/usr/bin/env python3
 import argparse
+import functools
+import heapq
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
 import random
 import sys
 import time
 
-# ==============================================================
-# Declare global variables
-# ==============================================================
-
-# Verbose (DEBUG) mode
-global DEBUG
-# Matrix related
-global C, C_prime, row_map, col_map, i_from, j_to, max_Dij
-# Tree related
-global X, Y, Y_bar, candidate_nodes
-# Tour related
-global current_tour, best_tour, best_cost, names
-# Iteration counter
-global iterations
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # ==============================================================
-# DEBUG printing functions
+# Utility classes
 # ==============================================================
 
-def debug(text):
-    global DEBUG
-    if DEBUG:
-        print(text)
-
-
-def debug_M(matrix_name, M):
-    global DEBUG
-    if DEBUG:
-        print_M(matrix_name, M)
-
-
-def debug_block_name(block_no):
-    global DEBUG
-    global iterations
-
-    if DEBUG:
-        print('=========================')
-        print(f'Block {block_no} (iteration {iterations})')
-        print('=========================\n')
+# Paths are packed into a single int: i << ARC_BITS | j,
+# negative for the excluded path (-i,-j), 0 for the root
+ARC_BITS = 16
+ARC_MASK = (1 << ARC_BITS) - 1
 
 
-# ==============================================================
-# Functions checking for correctness
-# ==============================================================
-def check_tour(tour, check_len=True, flatten=False):
-    global C
+def pack_path(path):
+    i, j = path
+    if i is None:
+        return 0
+    elif i < 0:
+        return -(-i << ARC_BITS | -j)
+    else:
+        return i << ARC_BITS | j
 
-    if flatten:
-        tour = [city for sublist in tour for city in sublist]
-    if check_len:
-        assert len(tour) == len(C), \
-            'The tour is shorter than the number of cities'
 
-    assert len(tour) == len(set(tour)), \
-        'There are repeated vertices in the current tour'
+def unpack_path(arc):
+    if arc == 0:
+        return None, None
+    elif arc < 0:
+        return -(-arc >> ARC_BITS), -(-arc & ARC_MASK)
+    else:
+        return arc >> ARC_BITS, arc & ARC_MASK
 
 
-# ==============================================================
-# Utility classes
-# ==============================================================
-
-# Binary tree node
+# Search tree node
+#
+# There may be millions of candidate nodes, so a node has
+# no __dict__, and it only knows its parent: the nodes of
+# the pruned subtrees are freed as soon as they are not
+# candidates any more (nor ancestors of candidates).
 class Node:
 
+    __slots__ = ('parent', 'arc', 'bound', 'matrix_bound', 'depth',
+                 'snapshot', 'anchor', 'order')
+
     def __init__(self, parent, path, bound=None):
         self.parent = parent
-        self.path = path
-        self.left_child = None
-        self.right_child = None
+        # the path (i,j), packed (see pack_path)
+        self.arc = pack_path(path)
         self.bound = bound
-
-
-# Priority queue
+        # the bound given by the reduced matrix alone (the
+        # cost of the included paths plus all subtrahends).
+        # It is the same as bound, unless the one_tree bound
+        # is higher (see TSPSolver.set_bound)
+        self.matrix_bound = bound
+        self.depth = parent.depth + 1 if parent else 0
+        # see class Snapshot
+        self.snapshot = None
+        # snapshot of the closest ancestor whose matrix
+        # was saved (see save_anchor)
+        self.anchor = None
+        # order among the candidate nodes of equal bounds
+        # (see CandidateNodes)
+        self.order = 0
+
+    @property
+    def path(self):
+        return unpack_path(self.arc)
+
+    def __lt__(self, other):
+        if self.bound != other.bound:
+            return self.bound < other.bound
+        return self.order < other.order
+
+
+# Strategies of choosing the next vertex (see
+# TSPSolver.block_9):
+# - best_first: the vertex with the lowest bound
+# - best_first_depth: the same, the deepest one among
+#   vertices with equal bounds
+# - depth_first: the child Y of the current vertex, as long
+#   as it can give a better tour, then back to the vertex
+#   with the lowest bound
+# - hybrid: best_first, depth_first while there are more
+#   than queue_limit candidate nodes
+STRATEGIES = ['best_first', 'best_first_depth', 'depth_first', 'hybrid']
+
+# default queue_limit of the hybrid strategy
+QUEUE_LIMIT = 100000
+
+# Rules of choosing the path to branch on among the ones
+# with the largest D[i,j] (see TSPSolver.choose_path):
+# - first: the first one found (row by row)
+# - cost: the cheapest one in the input matrix
+# - fragment: the one making the longest fragment
+# - strong: among the strong_candidates paths with the
+#   largest D[i,j] (not only the equal ones), the one whose
+#   children have the highest bounds (the lowest of the two
+#   bounds first, then the highest)
+BRANCHING_RULES = ['first', 'cost', 'fragment', 'strong']
+
+# default strong_candidates of the strong branching rule
+STRONG_CANDIDATES = 4
+
+
+# Priority queue (binary heap)
+#
+# Nodes are ordered by their bound. Among nodes with
+# equal bounds the most recently added one comes first
+# (the same order the previous sorted list insertion
+# produced), so the search visits nodes in the same order.
+# With depth_ties, the deepest one comes first. The heap
+# holds the nodes themselves (see Node.__lt__), so the
+# bound of a node must not change while it is a candidate.
 class CandidateNodes:
 
-    def __init__(self):
-        self.nodelist = []
+    def __init__(self, depth_ties=False):
+        self.heap = []
         self.size = 0
+        # the largest size so far
+        self.peak_size = 0
+        self.depth_ties = depth_ties
+        self.counter = itertools.count()
 
     def add(self, node):
-        for i in range(self.size):
-            if node.bound <= self.nodelist[i].bound:
-                self.nodelist.insert(i, node)
-                self.size += 1
-                return
-
-        self.nodelist.append(node)
+        node.order = -next(self.counter)
+        if self.depth_ties:
+            node.order -= node.depth << 40
+        heapq.heappush(self.heap, node)
         self.size += 1
+        self.peak_size = max(self.peak_size, self.size)
 
     def get(self):
-        return self.nodelist[0]
+        return self.heap[0]
 
     def pop(self):
-        node = self.nodelist[0]
-        self.nodelist = self.nodelist[1:]
+        node = heapq.heappop(self.heap)
         self.size -= 1
         return node
 
+    # remove the nodes whose bounds are at least max_bound
+    # and return them
+    def prune(self, max_bound):
+        kept = []
+        pruned = []
+        for node in self.heap:
+            if node.bound < max_bound:
+                kept.append(node)
+            else:
+                pruned.append(node)
+
+        if pruned:
+            heapq.heapify(kept)
+            self.heap = kept
+            self.size = len(kept)
+
+        return pruned
+
+
+# Partial tour: the paths added so far joined into
+# sublists (fragments). Each fragment is known by its
+# first (head) and last (tail) city, so adding a path,
+# finding out whether it would close a cycle and merging
+# two fragments all take constant time.
+class Fragments:
+
+    def __init__(self):
+        # next and previous city of each city in its fragment
+        self.succ = {}
+        self.pred = {}
+        # tail of the fragment by its head and vice versa
+        self.tail_of = {}
+        self.head_of = {}
+
+    def __len__(self):
+        return len(self.tail_of)
+
+    def __repr__(self):
+        return repr(self.sublists())
+
+    def copy(self):
+        new = Fragments()
+        new.succ = self.succ.copy()
+        new.pred = self.pred.copy()
+        new.tail_of = self.tail_of.copy()
+        new.head_of = self.head_of.copy()
+        return new
+
+    # add path i -> j and return the path from the tail
+    # of the fragment it ends up in back to its head, which
+    # would close a cycle. It is not added (and None is
+    # returned) if it would close a cycle itself (i is the
+    # tail of the fragment whose head is j)
+    def add(self, i, j):
+        if self.head_of.get(i) == j:
+            return None
+
+        assert i not in self.succ and j not in self.pred, \
+            'There are repeated vertices in the current tour'
+
+        # i is either a tail or not in any fragment yet,
+        # and j is either a head or not in any fragment yet
+        head = self.head_of.pop(i, i)
+        tail = self.tail_of.pop(j, j)
+        self.tail_of[head] = tail
+        self.head_of[tail] = head
+
+        self.succ[i] = j
+        self.pred[j] = i
+        return tail, head
+
+    # remove path i -> j, which splits its fragment in two
+    def remove(self, i, j):
+        del self.succ[i]
+        del self.pred[j]
+
+        head = i
+        while head in self.pred:
+            head = self.pred[head]
+        tail = j
+        while tail in self.succ:
+            tail = self.succ[tail]
+
+        del self.tail_of[head]
+        del self.head_of[tail]
+
+        if head != i:
+            self.tail_of[head] = i
+            self.head_of[i] = head
+        if tail != j:
+            self.tail_of[j] = tail
+            self.head_of[tail] = j
+
+    # number of cities in the fragment which adding
+    # path i -> j would make
+    def joined_length(self, i, j):
+        length = 0
+        city = self.head_of.get(i, i)
+        while city is not None:
+            length += 1
+            city = self.succ.get(city)
+        city = j
+        while city is not None:
+            length += 1
+            city = self.succ.get(city)
+        return length
+
+    # fragments as lists of cities
+    def sublists(self):
+        sublists = []
+        for head in self.tail_of:
+            sublist = [head]
+            while sublist[-1] in self.succ:
+                sublist.append(self.succ[sublist[-1]])
+            sublists.append(sublist)
+        return sublists
+
+
+# State of a candidate node: its matrix C_prime (with
+# row_map and col_map) and its partial tour. The matrix
+# still has to be simplified for the rows and columns in
+# dirty_rows and dirty_cols; base_bound is the bound
+# before that simplification.
+class Snapshot:
+
+    def __init__(self, base_bound, C_prime, row_map, col_map,
+                 current_tour, dirty_rows, dirty_cols, depth=None):
+        self.depth = depth
+        self.base_bound = base_bound
+        self.C_prime = C_prime
+        self.row_map = row_map
+        self.col_map = col_map
+        self.current_tour = current_tour
+        self.dirty_rows = dirty_rows
+        self.dirty_cols = dirty_cols
+        self.size = matrix_size_in_bytes(C_prime)
+
+
+# Snapshots of candidate nodes, kept within a memory
+# budget (in bytes). When it is exceeded, the snapshots
+# of the least promising nodes (the ones with the highest
+# bounds) are dropped; block_11 then rebuilds those nodes
+# from the root as usual.
+class SnapshotStore:
+
+    def __init__(self, budget=0):
+        self.budget = budget
+        self.used = 0
+        self.count = 0
+        # max-heap of nodes with snapshots (by bound)
+        self.heap = []
+        self.counter = itertools.count()
+
+    def add(self, node, snapshot):
+        if snapshot.size > self.budget:
+            return
+
+        node.snapshot = snapshot
+        self.used += snapshot.size
+        self.count += 1
+        heapq.heappush(self.heap, (-node.bound, next(self.counter), node))
+
+        while self.used > self.budget:
+            self.drop(heapq.heappop(self.heap)[2])
+
+        # forget nodes whose snapshots were already taken
+        if len(self.heap) > 2 * self.count + 16:
+            self.heap = [entry for entry in self.heap
+                         if entry[2].snapshot is not None]
+            heapq.heapify(self.heap)
+
+    def drop(self, node):
+        snapshot = node.snapshot
+        if snapshot is not None:
+            node.snapshot = None
+            self.used -= snapshot.size
+            self.count -= 1
+        return snapshot
+
+    def take(self, node):
+        return self.drop(node)
+
 
 # ==============================================================
 # Utility functions
@@ -113,6 +345,19 @@ class CandidateNodes:
 # program variables
 # --------------------------------------------------
 
+# Matrices are either lists of lists (None meaning INF)
+# or, with the NumPy engine, float arrays (INF meaning INF)
+INF = float('inf')
+
+# with ENGINE == 'auto', the NumPy engine is used
+# for matrices of at least this size
+ARRAY_ENGINE_MIN_SIZE = 50
+
+
+def is_array(M):
+    return np is not None and isinstance(M, np.ndarray)
+
+
 # convert one-indexed to zero-indexed
 # ind = index
 def ind(index):
@@ -120,6 +365,9 @@ def ind(index):
 
 
 def print_M(matrix_name, M):
+    if is_array(M):
+        M = [[None if x == INF else int(x) for x in row] for row in M.tolist()]
+
     print(f'{matrix_name} = ')
     for row in M:
         print('    ', row)
@@ -142,50 +390,200 @@ def min_no_element(row, index):
     return min_no_none(row)
 
 
-# M = matrix
-def transpose(M):
-    return list(map(list, zip(*M)))
+# make the tour start from city no. 1
+def tour_from_city_1(tour):
+    index_of_1 = tour.index(1)
+    return tour[index_of_1:] + tour[:index_of_1]
+
+
+# copy of the tour (see class Fragments) without
+# path i -> j, which splits its fragment in two
+def tour_without_path(tour, i, j):
+    new_tour = tour.copy()
+    new_tour.remove(i, j)
+    return new_tour
+
+
+# how much more (as a part of the lower bound) the tour
+# may cost than the best tour. None if it is not known
+def find_gap(cost, lower_bound):
+    if cost is None or lower_bound is None or lower_bound == INF:
+        return None
+    if cost == lower_bound:
+        return 0.0
+    if lower_bound <= 0:
+        return None
+    return (cost - lower_bound) / lower_bound
+
+
+# The matrix M always keeps its full size. Rows and
+# columns are deleted by removing their numbers from
+# the lists of active rows and columns, which the
+# functions below get as 'rows' and 'cols'. Only the
+# elements in active rows and columns are looked at.
+
+def copy_matrix(M):
+    if is_array(M):
+        return M.copy()
+    return [row[:] for row in M]
+
+
+# approximate memory taken by the matrix (the numbers
+# in a list are mostly shared, so they are not counted)
+def matrix_size_in_bytes(M):
+    if is_array(M):
+        return M.nbytes
+    return sys.getsizeof(M) + len(M) * sys.getsizeof(M[0])
+
+
+# set the element of the i-th row and j-th column to INF
+def set_inf(M, i, j):
+    if is_array(M):
+        M[ind(i), ind(j)] = INF
+    else:
+        M[ind(i)][ind(j)] = None
+
+
+# Remove the number from the map, keeping the positions
+# of the remaining numbers correct. This takes O(n) time
+# (the list is shifted and the later positions are
+# renumbered), not O(1) as a mask of deleted rows and
+# columns would. The maps stay dense, so simplify and
+# find_max_Dij, which take O(n^2) time every iteration
+# anyway, never have to skip deleted rows and columns.
+def remove_from_map(_map, _pos, number):
+    index = _pos[number]
+    _map.pop(index)
+    _pos[number] = None
+
+    for i in range(index, len(_map)):
+        _pos[_map[i]] = i
+
+
+# get the active part of the matrix as a list of lists
+def active_submatrix(M, rows, cols):
+    return [[M[ind(i)][ind(j)] for j in cols] for i in rows]
+
+
+# subtract all elements in each of the given rows
+# by the smallest value in that row
+def reduce_rows(M, rows, cols):
+    subs = 0
+    cols = [ind(j) for j in cols]
+
+    for i in rows:
+        row = M[ind(i)]
+        min_x = min_no_none([row[j] for j in cols])
+        if min_x:
+            subs += min_x
+            for j in cols:
+                if row[j] is not None:
+                    row[j] -= min_x
+
+    return subs
 
 
-# subtract all elements in a row by
-# the smallest value in that row
-def subtract_min(M):
+# subtract all elements in each of the given columns
+# by the smallest value in that column
+def reduce_cols(M, rows, cols):
     subs = 0
-    for i, row in enumerate(M):
-        min_x = min_no_none(row)
-        subs += min_x
-        M[i] = [(x - min_x) if x is not None else None for x in row]
-    return M, subs
+    rows = [M[ind(i)] for i in rows]
+
+    for j in cols:
+        j = ind(j)
+        min_x = min_no_none([row[j] for row in rows])
+        if min_x:
+            subs += min_x
+            for row in rows:
+                if row[j] is not None:
+                    row[j] -= min_x
+
+    return subs
 
 
-def simplify(M):
+# Only the changed rows and then the changed columns
+# (all of them by default) are simplified. If every
+# other row and column already has a zero (or only None
+# values), the result is the same as simplifying them all.
+def simplify(M, rows, cols, changed_rows=None, changed_cols=None):
+    if changed_rows is None:
+        changed_rows = rows
+    if changed_cols is None:
+        changed_cols = cols
+
+    if is_array(M):
+        return simplify_array(M, rows, cols, changed_rows, changed_cols)
+
     # we collect all the numbers that were
     # subtracted from rows and columns
     sum_subtrahends = 0
 
     # apply one run of subtraction on rows
-    M, sum_subs = subtract_min(M)
-    sum_subtrahends += sum_subs
+    sum_subtrahends += reduce_rows(M, changed_rows, cols)
 
     # apply one run of subtraction on columns
-    # We transpose M to get M_T
-    M_T = transpose(M)
-    M_T, sum_subs = subtract_min(M_T)
-    sum_subtrahends += sum_subs
-    M = transpose(M_T)
+    sum_subtrahends += reduce_cols(M, rows, changed_cols)
 
     return M, sum_subtrahends
 
 
-def find_max_Dij(M):
-    _max_Dij = 0
-    paths = []
+# the paths with the largest D[i,j] (see find_Dij),
+# in the order they were found, and that D[i,j]
+def find_max_Dij(M, rows, cols):
+    D_paths = find_Dij(M, rows, cols)
+
+    if not D_paths:
+        return [], 0
 
-    M_T = transpose(M)
+    _max_Dij = max(D_ij for D_ij, _, _ in D_paths)
+    paths = [[i, j] for D_ij, i, j in D_paths if D_ij == _max_Dij]
 
-    for i, row in enumerate(M, 1):
-        for j, el in enumerate(row, 1):
-            if el == 0:
+    return paths, _max_Dij
+
+
+# add x, found at the given position of a row or column,
+# to its [minimum, position of the minimum, second minimum]
+def add_to_two_min(two_min, x, position):
+    if two_min[0] is None or x < two_min[0]:
+        two_min[2] = two_min[0]
+        two_min[0] = x
+        two_min[1] = position
+    elif two_min[2] is None or x < two_min[2]:
+        two_min[2] = x
+
+
+# [D[i,j], i, j] for every path i -> j whose element
+# is zero, row by row
+def find_Dij(M, rows, cols):
+    if is_array(M):
+        return find_Dij_array(M, rows, cols)
+
+    D_paths = []
+    col_indices = [ind(j) for j in cols]
+
+    # minimums of every row and column are found once, in
+    # one pass over the active elements of M (without copying
+    # or transposing it), instead of once for every zero element
+    rows_two_min = [[None, None, None] for _ in rows]
+    cols_two_min = [[None, None, None] for _ in cols]
+
+    for p, i in enumerate(rows):
+        row = M[ind(i)]
+        row_two_min = rows_two_min[p]
+        for q, j in enumerate(col_indices):
+            el = row[j]
+            if el is not None:
+                add_to_two_min(row_two_min, el, q)
+                add_to_two_min(cols_two_min[q], el, p)
+
+    for p, i in enumerate(rows):
+        row_min, row_min_index, row_second_min = rows_two_min[p]
+        if row_min != 0:
+            continue
+
+        row = M[ind(i)]
+        for q, j in enumerate(col_indices):
+            if row[j] == 0:
                 # i-th row and j-th column element is zero
                 # hence there is no path i -> j, meaning there are
                 # such paths 1 -> k and l -> 2 where k != 2 and l != 1.
@@ -194,54 +592,777 @@ def find_max_Dij(M):
                 # the size D[i,j] =
                 #   min(i-th row without j-th element) +
                 #   min(j-th column without i-th element)
+                #
+                # The minimum of a row without one of its elements
+                # is the second minimum if that element is the
+                # (first found) minimum, and the minimum otherwise.
+                # A row or column without other elements adds 0.
+                col_min, col_min_index, col_second_min = cols_two_min[q]
+
                 D_ij = \
-                    min_no_element(M[ind(i)], ind(j)) + \
-                    min_no_element(M_T[ind(j)], ind(i))
+                    ((row_second_min or 0) if q == row_min_index
+                     else row_min) + \
+                    ((col_second_min or 0) if p == col_min_index
+                     else col_min)
 
-                if D_ij == _max_Dij:
-                    paths.append([row_map[ind(i)], col_map[ind(j)]])
-                elif D_ij > _max_Dij:
-                    _max_Dij = D_ij
-                    paths = [[row_map[ind(i)], col_map[ind(j)]]]
+                D_paths.append([D_ij, i, cols[q]])
+
+    return D_paths
+
+
+# --------------------------------------------------
+# Same as above, for the NumPy engine
+# --------------------------------------------------
+
+# index arrays (zero-indexed) for the active part
+# of the matrix
+def active_block(rows, cols):
+    return np.ix_(np.array(rows, dtype=int) - 1,
+                  np.array(cols, dtype=int) - 1)
+
+
+# smallest value in every row (axis=1) or column
+# (axis=0) with INF counted as 0
+def min_no_inf(M, axis):
+    mins = M.min(axis=axis)
+    mins[mins == INF] = 0
+    return mins
+
+
+# smallest value, its position and the second
+# smallest value in every row (axis=1) or column
+# (axis=0), with INF counted as 0
+def two_min_no_inf(M, axis):
+    first_pos = M.argmin(axis=axis)
+    two_smallest = np.partition(M, 1, axis=axis)
+
+    first = np.take(two_smallest, 0, axis=axis)
+    first[first == INF] = 0
+    second = np.take(two_smallest, 1, axis=axis)
+    second[second == INF] = 0
+
+    return first, first_pos, second
+
+
+def simplify_array(M, rows, cols, changed_rows, changed_cols):
+    block = active_block(changed_rows, cols)
+    row_mins = min_no_inf(M[block], axis=1)
+    M[block] -= row_mins[:, None]
+
+    block = active_block(rows, changed_cols)
+    col_mins = min_no_inf(M[block], axis=0)
+    M[block] -= col_mins[None, :]
+
+    return M, int(row_mins.sum() + col_mins.sum())
+
+
+def find_Dij_array(M, rows, cols):
+    M = M[active_block(rows, cols)]
+    zero_rows, zero_cols = np.nonzero(M == 0)
+
+    if not len(zero_rows):
+        return []
+
+    row_first, row_first_pos, row_second = two_min_no_inf(M, axis=1)
+    col_first, col_first_pos, col_second = two_min_no_inf(M, axis=0)
+
+    # D[i,j] for every zero element: the minimum of the row (column)
+    # without the element is the second minimum if the element itself
+    # is the (first found) minimum, else the first minimum
+    D = \
+        np.where(zero_cols == row_first_pos[zero_rows],
+                 row_second[zero_rows], row_first[zero_rows]) + \
+        np.where(zero_rows == col_first_pos[zero_cols],
+                 col_second[zero_cols], col_first[zero_cols])
+
+    return [[int(D_ij), rows[i], cols[j]]
+            for D_ij, i, j in zip(D.tolist(), zero_rows.tolist(),
+                                  zero_cols.tolist())]
+
+
+# --------------------------------------------------
+# Assignment problem (for the assignment bound)
+# --------------------------------------------------
+
+# Solve the assignment problem for the matrix A (a list
+# of lists of non-negative numbers, INF meaning no path).
+#
+# The rows are first assigned to zeros of A, and each of
+# the remaining rows by the shortest augmenting path (the
+# Hungarian method), so it is fast when A was reduced by
+# the parent vertex already. Returns the potentials of the
+# rows and the columns (A[r][c] - u[r] - v[c] >= 0, with
+# equality for the assigned elements, so the sum of the
+# potentials is the cost of the assignment), or None, None
+# if every assignment has an INF element.
+def solve_assignment(A):
+    n = len(A)
+    u = [0] * n
+    v = [0] * n
+    row_match = [-1] * n
+    col_match = [-1] * n
+
+    for r, row in enumerate(A):
+        for c, x in enumerate(row):
+            if x == 0 and col_match[c] < 0:
+                row_match[r] = c
+                col_match[c] = r
+                break
+
+    for s in range(n):
+        if row_match[s] >= 0:
+            continue
+
+        # shortest paths from row s to every column
+        dist = [A[s][c] - u[s] - v[c] for c in range(n)]
+        pred = [s] * n
+        scanned = [False] * n
+
+        while True:
+            c_min = -1
+            d_min = INF
+            for c in range(n):
+                if not scanned[c] and dist[c] < d_min:
+                    c_min = c
+                    d_min = dist[c]
+
+            if c_min < 0:
+                return None, None
+
+            scanned[c_min] = True
+            r = col_match[c_min]
+            if r < 0:
+                break
+
+            row = A[r]
+            u_r = u[r]
+            for c in range(n):
+                if not scanned[c]:
+                    d = d_min + row[c] - u_r - v[c]
+                    if d < dist[c]:
+                        dist[c] = d
+                        pred[c] = r
+
+        for c in range(n):
+            if scanned[c]:
+                diff = d_min - dist[c]
+                v[c] -= diff
+                if col_match[c] >= 0:
+                    u[col_match[c]] += diff
+        u[s] += d_min
+
+        # assign along the path
+        c = c_min
+        while True:
+            r = pred[c]
+            col_match[c] = r
+            row_match[r], c = c, row_match[r]
+            if r == s:
+                break
+
+    return u, v
+
+
+# the active part of the matrix as a list of lists
+# (INF meaning INF)
+def active_submatrix_inf(M, rows, cols):
+    if is_array(M):
+        return M[active_block(rows, cols)].tolist()
+    return [[INF if x is None else x for x in row]
+            for row in active_submatrix(M, rows, cols)]
+
+
+# Subtract the potentials of the assignment problem from
+# the active part of M, like simplify does with the row
+# and column minimums. Returns the matrix and the sum of
+# subtrahends (the cost of the assignment), which is INF
+# if there is no assignment (hence no tour) at all.
+def simplify_by_assignment(M, rows, cols):
+    u, v = solve_assignment(active_submatrix_inf(M, rows, cols))
+
+    if u is None:
+        return M, INF
+
+    if is_array(M):
+        M[active_block(rows, cols)] -= \
+            np.array(u)[:, None] + np.array(v)[None, :]
+        return M, int(sum(u) + sum(v))
+
+    for i, u_i in zip(rows, u):
+        row = M[ind(i)]
+        for j, v_j in zip(cols, v):
+            if row[ind(j)] is not None:
+                row[ind(j)] -= u_i + v_j
+
+    return M, sum(u) + sum(v)
+
+
+# the cost of the assignment problem for the active part
+# of M without path i -> j (M itself is not changed)
+def assignment_cost_without_path(M, rows, cols, i, j):
+    A = active_submatrix_inf(M, rows, cols)
+    A[rows.index(i)][cols.index(j)] = INF
+
+    u, v = solve_assignment(A)
+
+    if u is None:
+        return INF
+    return sum(u) + sum(v)
+
+
+# --------------------------------------------------
+# 1-trees (for the one_tree bound)
+# --------------------------------------------------
+
+# the number of subgradient steps for the penalties of
+# the root, and of every other vertex (which starts from
+# the penalties of the vertex before it)
+ONE_TREE_ROOT_ITERATIONS = 100
+ONE_TREE_ITERATIONS = 10
+
+# how far above the bound the subgradient steps aim (as
+# a part of the bound), for the root and for every
+# other vertex
+ONE_TREE_ROOT_GAP = 0.05
+ONE_TREE_GAP = 0.005
+
+# the weight of the paths which have to be in the 1-tree
+FORCED = -INF
+
+
+def is_symmetric(M):
+    return all(M[i][j] == M[j][i]
+               for i in range(len(M)) for j in range(i))
+
+
+# Find the minimum 1-tree of the graph W (a symmetric list
+# of lists of edge weights, INF meaning no edge and FORCED
+# an edge which has to be in the 1-tree), with the
+# weights of the edges u - v increased by the penalties
+# pi[u] + pi[v]. The 1-tree is the minimum spanning tree
+# of the vertices 1, 2, ... (by Prim's algorithm) and the
+# two lightest edges of vertex 0. The forced edges are
+# counted as weighing 0.
+#
+# Returns its weight and the degrees of the vertices, or
+# None, None if there is no 1-tree.
+def one_tree(W, pi):
+    m = len(W)
+    degrees = [0] * m
+
+    # the tree starts from vertex 1
+    in_tree = [False] * m
+    in_tree[0] = in_tree[1] = True
+    key = [W[1][v] + pi[1] + pi[v] for v in range(m)]
+    parent = [1] * m
+    weight = 0
+
+    for _ in range(m - 2):
+        u = -1
+        key_u = INF
+        for v in range(m):
+            if not in_tree[v] and key[v] < key_u:
+                u = v
+                key_u = key[v]
+
+        if u < 0:
+            return None, None
+
+        in_tree[u] = True
+        weight += pi[parent[u]] + pi[u] if key_u == FORCED else key_u
+        degrees[u] += 1
+        degrees[parent[u]] += 1
+
+        W_u = W[u]
+        pi_u = pi[u]
+        for v in range(m):
+            if not in_tree[v] and W_u[v] + pi_u + pi[v] < key[v]:
+                key[v] = W_u[v] + pi_u + pi[v]
+                parent[v] = u
+
+    # the two lightest edges of vertex 0
+    edges = sorted((W[0][v] + pi[0] + pi[v], v) for v in range(1, m))[:2]
+
+    if len(edges) < 2 or edges[1][0] == INF:
+        return None, None
+
+    for key_v, v in edges:
+        weight += pi[0] + pi[v] if key_v == FORCED else key_v
+        degrees[0] += 1
+        degrees[v] += 1
+
+    return weight, degrees
+
+
+# The Held-Karp bound: improve the penalties pi (by
+# subgradient optimization) so that the weight of the
+# minimum 1-tree of W minus twice the sum of penalties,
+# which is a lower bound for every tour, is as high as
+# possible. Stops early if the bound reaches upper (the
+# cost of the best tour so far, if there is one).
+#
+# Returns the best bound (INF if there is no tour at all)
+# and its penalties.
+def held_karp_bound(W, pi, upper, iterations, step, gap):
+    best_bound = -INF
+    best_pi = pi
+
+    for _ in range(iterations):
+        weight, degrees = one_tree(W, pi)
+
+        if weight is None:
+            return INF, pi
+
+        bound = weight - 2 * sum(pi)
+        if bound > best_bound:
+            best_bound = bound
+            best_pi = pi
+
+        if upper is not None and best_bound >= upper:
+            break
+
+        subgradient = [d - 2 for d in degrees]
+        norm = sum(g * g for g in subgradient)
+
+        # the 1-tree is a tour
+        if norm == 0:
+            break
+
+        # aim a bit above the bound
+        target = bound + abs(bound) * gap + 1
+        if upper is not None:
+            target = min(target, upper)
+        t = step * (target - bound) / norm
+        pi = [p + t * g for p, g in zip(pi, subgradient)]
+
+        # the step is halved every fourth of the iterations
+        step *= 0.5 ** (4 / iterations)
+
+    return best_bound, best_pi
+
+
+# --------------------------------------------------
+# Heuristic tours (an upper bound for the best tour)
+# --------------------------------------------------
+
+# the number of cities nearest neighbour
+# tours are started from
+HEURISTIC_STARTS = 10
 
-    return paths, _max_Dij
+
+# In the functions below cities are zero-indexed and
+# W is the distance matrix where a missing path has a
+# very big cost instead of None
+
+
+def tour_cost(W, tour):
+    return sum(W[tour[k - 1]][tour[k]] for k in range(len(tour)))
+
+
+# always go to the nearest city which was not visited yet
+def nearest_neighbour_tour(W, start):
+    tour = [start]
+    unvisited = set(range(len(W))) - {start}
+
+    while unvisited:
+        row = W[tour[-1]]
+        city = min(unvisited, key=lambda j: (row[j], j))
+        tour.append(city)
+        unvisited.remove(city)
+
+    return tour
+
+
+# Reverse a part of the tour if that makes the tour
+# shorter. As the matrix is not symmetric, the paths of
+# the reversed part change their costs too, so they are
+# summed up in both directions (forward and backward).
+# Returns True if the tour was changed.
+def two_opt(W, tour):
+    n = len(tour)
+
+    forward = [0] * n
+    backward = [0] * n
+    for k in range(1, n):
+        forward[k] = forward[k - 1] + W[tour[k - 1]][tour[k]]
+        backward[k] = backward[k - 1] + W[tour[k]][tour[k - 1]]
+
+    # reverse tour[i..j]: a -> b ... c -> d
+    # becomes a -> c ... b -> d
+    for i in range(1, n - 1):
+        a, b = tour[i - 1], tour[i]
+        for j in range(i + 1, n):
+            c, d = tour[j], tour[(j + 1) % n]
+
+            old = W[a][b] + W[c][d] + forward[j] - forward[i]
+            new = W[a][c] + W[b][d] + backward[j] - backward[i]
+
+            if new < old:
+                tour[i:j + 1] = tour[i:j + 1][::-1]
+                return True
+
+    return False
+
+
+# Move a part of the tour of 1 to 3 cities (in the same
+# direction) to another place in the tour if that makes
+# the tour shorter. Returns True if the tour was changed.
+def or_opt(W, tour):
+    n = len(tour)
+
+    for length in (1, 2, 3):
+        if n < length + 3:
+            break
+
+        # the part tour[i..i + length - 1] is
+        # taken out from between p and q
+        for i in range(1, n - length + 1):
+            p, first = tour[i - 1], tour[i]
+            last, q = tour[i + length - 1], tour[(i + length) % n]
+            removed = W[p][first] + W[last][q] - W[p][q]
+
+            rest = tour[:i] + tour[i + length:]
+
+            # and put between x and y
+            for k in range(len(rest)):
+                x, y = rest[k], rest[(k + 1) % len(rest)]
+                if x == p:
+                    continue
+
+                if W[x][first] + W[last][y] - W[x][y] < removed:
+                    tour[:] = rest[:k + 1] + tour[i:i + length] + \
+                        rest[k + 1:]
+                    return True
+
+    return False
+
+
+def improve_tour(W, tour):
+    while two_opt(W, tour) or or_opt(W, tour):
+        pass
+
+
+# The best of the nearest neighbour tours started from
+# several cities, each improved by local search. Returns
+# the tour (cities numbered from 1) and its cost, or
+# None, None if no tour was found.
+#
+# C is the distance matrix with None meaning INF
+def heuristic_tour(C):
+    n = len(C)
+
+    finite = [x for row in C for x in row if x is not None]
+    big = (max(finite) if finite else 0) * n + 1
+    W = [[big if x is None else x for x in row] for row in C]
+
+    best_tour = None
+    best_cost = None
+
+    step = max(1, n // HEURISTIC_STARTS)
+    for start in range(0, n, step)[:HEURISTIC_STARTS]:
+        tour = nearest_neighbour_tour(W, start)
+        improve_tour(W, tour)
+        cost = tour_cost(W, tour)
+
+        if best_cost is None or cost < best_cost:
+            best_tour = tour
+            best_cost = cost
+
+    # the tour has a missing path
+    if best_cost is None or best_cost >= big:
+        return None, None
+
+    return [city + 1 for city in best_tour], best_cost
+
+
+# --------------------------------------------------
+# Checkpoints (the state of the search in a file)
+# --------------------------------------------------
+
+# default number of seconds between checkpoints
+CHECKPOINT_INTERVAL = 60
+
+
+# The checkpoint is written to a temporary file first,
+# so the last one is not lost if the program is stopped
+# while writing
+def write_checkpoint(file_name, checkpoint):
+    with open(file_name + '.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, separators=(',', ':'))
+    os.replace(file_name + '.tmp', file_name)
+
+
+def read_checkpoint(file_name):
+    with open(file_name) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+# --------------------------------------------------
+# Forced paths (for sparse matrices)
+# --------------------------------------------------
+
+# Find the paths which every tour takes: the only path
+# out of a city, or the only path into it. Taking path
+# i -> j removes the other paths out of i and into j, and
+# the path which would close its fragment, so more paths
+# may become forced. Returns the fragments of the forced
+# paths and a copy of C (None meaning no path) without
+# the removed paths, or None, None if there is no tour.
+def find_forced_paths(C):
+    n = len(C)
+    C = [row[:] for row in C]
+    cities = range(1, n + 1)
+
+    # the paths out of and into every city (index 0
+    # is not used)
+    paths_out = [set()] + [
+        {j for j in cities if j != i and C[ind(i)][ind(j)] is not None}
+        for i in cities]
+    paths_in = [set()] + [
+        {i for i in cities if i != j and C[ind(i)][ind(j)] is not None}
+        for j in cities]
+
+    def remove_path(i, j):
+        C[ind(i)][ind(j)] = None
+        paths_out[i].discard(j)
+        paths_in[j].discard(i)
+
+    tour = Fragments()
+
+    def take_path(i, j):
+        # the last path closes the tour
+        if len(tour.succ) == n - 1:
+            return
+
+        tail, head = tour.add(i, j)
+        for k in list(paths_out[i]):
+            if k != j:
+                remove_path(i, k)
+        for k in list(paths_in[j]):
+            if k != i:
+                remove_path(k, j)
+        if len(tour.succ) < n - 1:
+            remove_path(tail, head)
+
+    changed = True
+    while changed and len(tour.succ) < n - 1:
+        changed = False
+
+        for i in cities:
+            if i in tour.succ:
+                continue
+            if not paths_out[i]:
+                return None, None
+            if len(paths_out[i]) == 1:
+                take_path(i, next(iter(paths_out[i])))
+                changed = True
+
+        for j in cities:
+            if j in tour.pred:
+                continue
+            if not paths_in[j]:
+                return None, None
+            if len(paths_in[j]) == 1:
+                take_path(next(iter(paths_in[j])), j)
+                changed = True
+
+    return tour, C
+
+
+# Contract every fragment of the forced paths (see
+# find_forced_paths) into a single city, which is entered
+# at the head of the fragment and left at its tail.
+# Returns the matrix of the contracted cities, the lists
+# of cities they stand for (by the head of the fragment)
+# and the cost of the forced paths. If a single city is
+# left, its only element is the path closing the tour.
+def contract_paths(C, tour):
+    chains = tour.sublists() + [
+        [k] for k in range(1, len(C) + 1)
+        if k not in tour.succ and k not in tour.pred]
+    chains.sort()
+
+    if len(chains) == 1:
+        contracted_C = [[C[ind(chains[0][-1])][ind(chains[0][0])]]]
+    else:
+        contracted_C = [
+            [None if k == k2 else C[ind(chain_k[-1])][ind(chain_k2[0])]
+             for k2, chain_k2 in enumerate(chains)]
+            for k, chain_k in enumerate(chains)]
+
+    cost = sum(C[ind(i)][ind(j)] for i, j in tour.succ.items())
+
+    return contracted_C, chains, cost
+
+
+# the tour of the contracted cities in the cities
+# they stand for
+def expand_tour(tour, chains):
+    return [city for k in tour for city in chains[ind(k)]]
 
 
 # --------------------------------------------------
-# Utilify functions which use main program variables
+# Dynamic programming (for small matrices)
 # --------------------------------------------------
 
-def print_names():
-    global best_tour, names
+# Matrices of at most this many cities are solved by
+# dynamic programming instead of branch and bound
+DP_THRESHOLD = 12 if np is not None else 8
+
+# The tables of dynamic programming grow as 2^n * n, so
+# larger matrices are never solved by it. At this size a
+# solve peaks at about 160 MB and takes about 0.7 s with
+# NumPy (250 MB and 11 s without it), while branch and
+# bound solves random matrices of this size in about
+# 0.01 s, which is why DP_THRESHOLD is much lower.
+DP_MAX_CITIES = 20
+
+
+# Solve TSP by dynamic programming over the subsets of
+# cities (the algorithm of Held and Karp). The tour starts
+# from city no. 1, and the best path from it through the
+# cities of every subset to each of them is found from
+# the paths through the subsets with one city less. It
+# takes O(2^n * n^2) time and O(2^n * n) memory for any
+# matrix, so it is only for small ones.
+#
+# C is the distance matrix with None meaning INF. Returns
+# the tour (cities numbered from 1) and its cost, or
+# None, None if there is no tour. The other cities are
+# numbered from 0 in the subsets (as bits).
+def dp_tour(C):
+    # the only tour of a single city goes nowhere
+    if len(C) == 1:
+        return [1], 0
+
+    if np is not None:
+        return dp_tour_array(C)
+
+    n = len(C)
+    assert n <= DP_MAX_CITIES, \
+        f'The matrix is too large for dynamic programming ({n} cities)'
+    m = n - 1
+    W = [[INF if x is None else x for x in row] for row in C]
+
+    # cost[S][j]: the best path from city no. 1 through the
+    # cities of S ending in j, and prev[S][j] the city before j
+    cost = [[INF] * m for _ in range(1 << m)]
+    prev = [[-1] * m for _ in range(1 << m)]
+    for j in range(m):
+        cost[1 << j][j] = W[0][j + 1]
+
+    # the subsets with fewer cities come first
+    for S in range(1, 1 << m):
+        cost_S = cost[S]
+        for i in range(m):
+            if cost_S[i] == INF:
+                continue
+            W_i = W[i + 1]
+            for j in range(m):
+                if S >> j & 1:
+                    continue
+                new_cost = cost_S[i] + W_i[j + 1]
+                if new_cost < cost[S | 1 << j][j]:
+                    cost[S | 1 << j][j] = new_cost
+                    prev[S | 1 << j][j] = i
+
+    full = (1 << m) - 1
+    last_costs = [cost[full][j] + W[j + 1][0] for j in range(m)]
+    best_cost = min(last_costs)
+
+    if best_cost == INF:
+        return None, None
+
+    return dp_path(prev, full, last_costs.index(best_cost)), best_cost
+
+
+# dp_tour for NumPy arrays: all the subsets with the same
+# number of cities are extended at once
+def dp_tour_array(C):
+    n = len(C)
+    assert n <= DP_MAX_CITIES, \
+        f'The matrix is too large for dynamic programming ({n} cities)'
+    m = n - 1
+    W = np.array([[INF if x is None else x for x in row] for row in C],
+                 dtype=float)
+    bits = 1 << np.arange(m)
+
+    cost = np.full((1 << m, m), INF)
+    prev = np.full((1 << m, m), -1, dtype=np.int8)
+    cost[bits, np.arange(m)] = W[0, 1:]
 
+    # number of cities in each subset
+    sizes = np.zeros(1 << m, dtype=np.int8)
+    for j in range(m):
+        sizes += np.arange(1 << m) >> j & 1
+
+    for size in range(1, m):
+        S = np.flatnonzero(sizes == size)
+        cost_S = cost[S]
+
+        # one city j at a time, so that only an (|S|, m)
+        # array of new costs is kept, not an (|S|, m, m) one
+        for j in range(m):
+            # each larger subset (with j) comes from exactly
+            # one subset S without j, so nothing is overwritten
+            outside = S & bits[j] == 0
+
+            # new_cost[s, i]: from the path ending in i to j
+            new_cost = cost_S[outside] + W[1:, j + 1]
+            best_i = new_cost.argmin(axis=1)
+            new_S = S[outside] | bits[j]
+            cost[new_S, j] = new_cost[np.arange(len(best_i)), best_i]
+            prev[new_S, j] = best_i
+
+    full = (1 << m) - 1
+    last_costs = cost[full] + W[1:, 0]
+    last = int(last_costs.argmin())
+
+    if last_costs[last] == INF:
+        return None, None
+
+    return dp_path(prev, full, last), int(last_costs[last])
+
+
+# the tour ending in city last (numbered from 0) which
+# goes through the cities of the subset S, restored from
+# the cities before each one (prev)
+def dp_path(prev, S, last):
+    tour = []
+    while last >= 0:
+        tour.append(last + 2)
+        S, last = S & ~(1 << last), int(prev[S][last])
+
+    return [1] + tour[::-1]
+
+
+# --------------------------------------------------
+# Printing the solution
+# --------------------------------------------------
+
+def print_names(tour, names):
     if names:
-        for v in best_tour:
+        for v in tour:
             print(f'{names[v]} ->', end=' ')
-        print(f'{names[best_tour[0]]}\n')
-
+        print(f'{names[tour[0]]}\n')
 
-def print_solution():
-    global best_tour, best_cost
 
+def print_solution(tour, cost, names=None):
     print('=========================')
-    print(f'Solution (size = {len(C)})')
+    print(f'Solution (size = {len(tour)})')
     print('=========================\n')
-    for v in best_tour:
+    for v in tour:
         print(f'{v} ->', end=' ')
-    print(best_tour[0])
-    print(f'\nCost = {best_cost}\n')
-    print_names()
+    print(tour[0])
+    print(f'\nCost = {cost}\n')
+    print_names(tour, names)
 
 
 # --------------------------------------------------
-# Utility functions which use and change main
-# program variables
+# Generate new matrix
 # --------------------------------------------------
 
-# -----------------------------
-# Generate new matrix
-# -----------------------------
-def generate_new_matrix(cities, weights, arcs=None):
+def generate_new_matrix(cities, weights, arcs=None, symmetric=False):
     M = []
     rows = cities
     cols = cities
@@ -282,579 +1403,1806 @@ def generate_new_matrix(cities, weights, arcs=None):
             M[i][j] = 0
             removable_arcs = removable_arcs[:removed_arc_index] + removable_arcs[removed_arc_index + 1:]
 
-    return M
-
-
-# -----------------------------
-# For matrix operations
-# -----------------------------
-def reset_C_prime():
-    global C_prime
-    C_prime = [row[:] for row in C]
-    reset_row_col_map()
-
-
-def reset_row_col_map():
-    global C_prime, row_map, col_map
-
-    row_map = [i for i in range(1, len(C_prime) + 1)]
-    col_map = [i for i in range(1, len(C_prime) + 1)]
-
-
-def delete_row_col(i_row, j_col):
-    global C_prime
-
-    # delete i-th row
-    C_prime = \
-        C_prime[:row_map.index(i_row)] + C_prime[(row_map.index(i_row) + 1):]
-
-    # delete j-th column
-    C_prime_T = transpose(C_prime)
-    C_prime_T = \
-        C_prime_T[:col_map.index(j_col)] + \
-        C_prime_T[(col_map.index(j_col) + 1):]
-    C_prime = transpose(C_prime_T)
-
-    fix_map_on_delete(i_row, j_col)
-
-
-def fix_map_on_delete(row_from_map, col_from_map):
-    global row_map, col_map
-
-    row_index = row_map.index(row_from_map) + 1
-    row_map.pop(ind(row_index))
+    # the path j -> i costs the same as i -> j
+    if symmetric:
+        for i in range(rows):
+            for j in range(i):
+                M[i][j] = M[j][i]
 
-    col_index = col_map.index(col_from_map) + 1
-    col_map.pop(ind(col_index))
+    return M
 
 
-def disable_path(i_row, j_col):
-    global row_map, col_map
+# ==============================================================
+# Solver
+# ==============================================================
 
-    if i_row in row_map and j_col in col_map:
-        C_prime[row_map.index(i_row)][col_map.index(j_col)] = None
+# Solves TSP with Little's branch and bound algorithm.
+# All the state of the search (the matrices, the tree
+# and the tours) belongs to the solver, so one solver
+# can be used for many matrices, one after another,
+# and several solvers can be used side by side.
+class TSPSolver:
+
+    def __init__(self, engine='auto', snapshot_memory=0,
+                 snapshot_depth=0, heuristic=None, bound='reduction',
+                 dp_threshold=DP_THRESHOLD, time_limit=None,
+                 node_limit=None, gap=None, checkpoint_file=None,
+                 checkpoint_interval=CHECKPOINT_INTERVAL,
+                 strategy='best_first', queue_limit=QUEUE_LIMIT,
+                 branching='first', strong_candidates=STRONG_CANDIDATES,
+                 transpositions=False, preprocessing=True, debug=False,
+                 shared_best_cost=None, shared_iterations=None,
+                 shared_lowest_bound=None, shared_stop=None):
+        # Verbose (DEBUG) mode
+        self.DEBUG = debug
+        # Matrix engine ('auto', 'list' or 'numpy')
+        self.ENGINE = engine
+        # memory (in bytes) for the matrices of candidate
+        # vertices (see class SnapshotStore)
+        self.snapshot_memory = snapshot_memory
+        # see save_anchor
+        self.snapshot_depth = snapshot_depth
+        # start with the best tour found by heuristics: True,
+        # False or None (only when it pays off, see use_heuristic)
+        self.heuristic = heuristic
+        # lower bound of the vertices: 'reduction' (of rows
+        # and columns), 'assignment' (see simplify_C_prime)
+        # or 'one_tree' (see one_tree_bound), which is used
+        # together with the assignment bound
+        self.bound = bound
+        # matrices of at most this many cities are solved
+        # by dynamic programming (see solve_by_dp), except in
+        # DEBUG mode, which shows the steps of branch and bound
+        self.dp_threshold = dp_threshold
+        # the search is stopped (see limit_reached) after
+        # time_limit seconds, after node_limit iterations, or
+        # as soon as the best tour so far is known to cost at
+        # most (1 + gap) times as much as the best tour
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.gap = gap
+        # the state of the search is saved to this file every
+        # checkpoint_interval seconds, and when it stops (see
+        # save_checkpoint)
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        # the strategy of choosing the next vertex (see
+        # STRATEGIES and block_9)
+        self.strategy = strategy
+        self.queue_limit = queue_limit
+        # the rule of choosing the path to branch on (see
+        # BRANCHING_RULES and choose_path)
+        self.branching = branching
+        self.strong_candidates = strong_candidates
+        # drop the vertices which are transpositions of
+        # cheaper ones (see is_transposition)
+        self.transpositions = transpositions
+        # contract the paths which every tour takes before
+        # branching (see preprocess)
+        self.preprocessing = preprocessing
+        # the cost of the best tour found by any of the
+        # solvers searching the same tree in parallel
+        # (a multiprocessing.Value, see solve_parallel)
+        self.shared_best_cost = shared_best_cost
+        # the number of iterations of all these solvers
+        # (for node_limit)
+        self.shared_iterations = shared_iterations
+        # the lowest bound of the vertices which wait for
+        # one of these solvers (see solve_parallel)
+        self.shared_lowest_bound = shared_lowest_bound
+        # set when these solvers should hand their open
+        # vertices back (see solve_parallel)
+        self.shared_stop = shared_stop
+
+        self.reset([])
+
+    # initialize the state of the solver for
+    # the distance matrix C
+    def reset(self, C):
+        # -----------------------------
+        # Matrix related
+        # -----------------------------
+        self.C = C
+        self.C_array = None
+        self.C_prime = None
+
+        # C before preprocessing, the cities which the cities
+        # of C stand for (if any paths were contracted) and
+        # the cost of the contracted paths (see preprocess)
+        self.input_C = C
+        self.chains = None
+        self.forced_cost = 0
+
+        self.row_map = []
+        self.col_map = []
+        self.row_pos = []
+        self.col_pos = []
+
+        self.dirty_rows = set()
+        self.dirty_cols = set()
+
+        self.i_from = None
+        self.j_to = None
+        self.max_Dij = None
+
+        # the one_tree bound is used (for symmetric
+        # matrices only), with these penalties of the
+        # cities to start from (see one_tree_bound)
+        self.one_tree = False
+        self.penalties = None
+
+        # the root vertex and its matrix (see save_root)
+        self.root = None
+        self.root_snapshot = None
+
+        self.reset_search()
+
+    # initialize the state of the search (the tree, the
+    # tours and the counters), keeping the matrix C
+    def reset_search(self):
+        # -----------------------------
+        # Tree related
+        # -----------------------------
+        self.X = None
+        self.Y = None
+        self.Y_bar = None
+        self.candidate_nodes = CandidateNodes(
+            depth_ties=self.strategy == 'best_first_depth')
+        # the number of candidate nodes which were pruned, and
+        # the best cost they were pruned with (see prune_candidates)
+        self.pruned = 0
+        self.pruned_with = INF
+        # the cost of the included paths of every vertex
+        # by its state, and the number of vertices dropped
+        # because of it (see is_transposition)
+        self.transposition_table = {}
+        self.transposition_count = 0
+        self.snapshots = SnapshotStore(self.snapshot_memory)
+
+        # -----------------------------
+        # Tour related
+        # -----------------------------
+        self.current_tour = Fragments()
+        self.closing_path = None
+        self.best_tour = []
+        self.best_cost = None
+
+        # -----------------------------
+        # Iteration counter
+        # -----------------------------
+        self.iterations = 0
+        self.start_time = None
+        self.deadline = None
+        self.next_checkpoint = None
+        # the limit which stopped the search (if any)
+        self.stopped_by = None
+
+    # Solve TSP for the distance matrix C (0 meaning that
+    # there is no path). Returns the best tour (starting
+    # from city no. 1), its cost and the statistics of the
+    # search: the number of iterations and time in seconds.
+    # If there is no tour at all, the tour is empty and
+    # its cost is None.
+    def solve(self, C):
+        if self.use_dp(C):
+            return self.solve_by_dp(C)
+
+        self.start(C)
+        self.search()
+        return self.result()
+
+    # the search by dynamic programming can not be saved
+    # to a checkpoint, so it is not used then
+    def use_dp(self, C):
+        return not self.DEBUG and self.checkpoint_file is None and \
+            len(C) <= min(self.dp_threshold, DP_MAX_CITIES)
+
+    # Solve TSP like solve, by dynamic programming (see
+    # dp_tour). Nothing is branched, so there are no
+    # iterations; the method in the statistics tells these
+    # runs apart.
+    def solve_by_dp(self, C):
+        start_time = time.time()
 
+        tour, cost = dp_tour([[None if x == 0 else x for x in row]
+                              for row in C])
+
+        stats = {'method': 'dp',
+                 'iterations': 0,
+                 'time': time.time() - start_time,
+                 'stopped_by': None,
+                 'lower_bound': cost,
+                 'gap': find_gap(cost, cost),
+                 'peak_queue': 0,
+                 'pruned': 0,
+                 'transpositions': 0}
+
+        return tour or [], cost, stats
+
+    # Start the search for the distance matrix C. The first
+    # vertex X is the root, or the vertex reached from the
+    # root by the given paths (see node_paths)
+    def start(self, C, paths=()):
+        self.reset(C)
+
+        self.start_time = time.time()
+        self.set_timers()
+
+        self.run_block(1)
+
+        if not self.preprocess():
+            return
+
+        if self.use_heuristic():
+            self.find_heuristic_tour()
+
+        self.run_block(2)
+
+        if paths:
+            for path in paths:
+                self.X = Node(self.X, path)
+            self.run_block(11)
+
+    # Save the root vertex and its matrix after start, so
+    # that the search can be started again at any of its
+    # descendants (see restart)
+    def save_root(self):
+        self.root = self.X
+        self.root_snapshot = Snapshot(
+            self.X.matrix_bound, copy_matrix(self.C_prime),
+            self.row_map[:], self.col_map[:], self.current_tour.copy(),
+            set(self.dirty_rows), set(self.dirty_cols), depth=0)
+
+    # Start the search again, for the same matrix, at the
+    # vertex reached from the saved root by the given paths.
+    # C is not preprocessed and the root is not simplified
+    # again: block_11 rebuilds the vertex starting from the
+    # matrix of the root, like from any other anchor.
+    def restart(self, paths):
+        self.reset_search()
+
+        self.start_time = time.time()
+        self.set_timers()
+
+        self.X = self.root
+        for path in paths:
+            self.X = Node(self.X, path)
+        self.X.anchor = self.root_snapshot
+        self.run_block(11)
+
+    # Branch and bound until the best tour is found. With
+    # max_open, the search stops early as soon as there are
+    # max_open open vertices (X and the candidate nodes).
+    # It also stops when a limit is reached (see
+    # limit_reached), or when a vertex waiting for another
+    # solver is more promising than X (see
+    # has_better_waiting) or when it is told to stop by the
+    # solvers it shares the search with. Returns True if the
+    # search has finished.
+    def search(self, max_open=None):
+        # solved by preprocess already
+        if self.X is None:
+            self.save_checkpoint(finished=True)
+            return True
 
-# -----------------------------
-# For adding a new path
-# -----------------------------
-def added_path_merge_on_i_from(s_index):
-    global j_to
-    global current_tour
+        while True:
+            if max_open and self.candidate_nodes.size + 1 >= max_open:
+                return False
 
-    for s2_index, sublist_2 in enumerate(current_tour):
-        if sublist_2[0] == j_to:
-            current_tour[s_index] = current_tour[s_index] + sublist_2[1:]
-            del (current_tour[s2_index])
-            return True
-    return False
+            if self.has_better_waiting() or \
+                    (self.shared_stop is not None and self.shared_stop.value):
+                return False
 
+            if self.limit_reached():
+                self.save_checkpoint()
+                return False
 
-def added_path_merge_on_j_to(s_index):
-    global i_from
-    global current_tour
+            if self.next_checkpoint is not None and \
+                    time.time() >= self.next_checkpoint:
+                self.save_checkpoint()
 
-    for s2_index, sublist_2 in enumerate(current_tour):
-        if sublist_2[-1] == i_from:
-            current_tour[s_index] = sublist_2[:-1] + current_tour[s_index]
-            del (current_tour[s2_index])
-            return True
-    return False
+            self.count_iteration()
+            if not self.run_block(3):
+                # no tour goes through X, take the next vertex
+                if not self.candidate_nodes.size:
+                    break
+                self.Y = None
+                self.X = self.candidate_nodes.pop()
+                if self.run_block(10):
+                    break
+                self.run_block(11)
+                continue
 
+            self.run_block(4)
+            self.run_block(5)
 
-def add_path_already_have_i_from(s_index, sublist):
-    global j_to
-    global current_tour
+            if self.run_block(6):
+                self.run_block(7)
+                self.run_block(8)
 
-    if sublist[0] == j_to:
-        return False
-    else:
-        current_tour[s_index].append(j_to)
+            self.run_block(9)
 
-        if added_path_merge_on_i_from(s_index):
-            return True
+            if not self.run_block(10):
+                self.run_block(11)
+            else:
+                break
 
+        self.save_checkpoint(finished=True)
         return True
 
+    # the best tour (starting from city no. 1), its cost
+    # and the statistics of the search (see solve), with
+    # the largest number of candidate nodes (peak_queue),
+    # the number of pruned ones (see prune_candidates) and
+    # of the dropped transpositions (see is_transposition)
+    def result(self):
+        end_time = time.time()
 
-def add_path_already_have_j_to(s_index, sublist):
-    global i_from
-    global current_tour
-
-    if sublist[-1] == i_from:
-        return False
-    else:
-        current_tour[s_index].insert(0, i_from)
+        best_tour = self.best_tour
+        best_cost = self.best_cost
+
+        if best_tour:
+            self.check_tour(best_tour)
+            if self.chains:
+                best_tour = expand_tour(best_tour, self.chains)
+            best_tour = tour_from_city_1(best_tour)
+            best_cost += self.forced_cost
+
+        # if the search has finished, no tour is
+        # cheaper than the best one found so far
+        lower_bound = self.incumbent_cost()
+        if lower_bound is None:
+            lower_bound = INF
+        if self.stopped_by:
+            lower_bound = min(self.lowest_bound(), lower_bound)
+        lower_bound += self.forced_cost
+
+        stats = {'method': 'branch_and_bound',
+                 'iterations': self.iterations,
+                 'time': end_time - self.start_time,
+                 'stopped_by': self.stopped_by,
+                 'lower_bound': None if lower_bound == INF else lower_bound,
+                 'gap': find_gap(best_cost, lower_bound),
+                 'peak_queue': self.candidate_nodes.peak_size,
+                 'pruned': self.pruned,
+                 'transpositions': self.transposition_count}
+
+        return best_tour, best_cost, stats
 
-        if added_path_merge_on_j_to(s_index):
-            return True
+    # --------------------------------------------------
+    # Limits of the search
+    # --------------------------------------------------
 
-        return True
+    # the time limit and the checkpoints count
+    # from the start of this run
+    def set_timers(self):
+        now = time.time()
+
+        if self.time_limit is not None:
+            self.deadline = now + self.time_limit
+        if self.checkpoint_file is not None:
+            self.next_checkpoint = now + self.checkpoint_interval
+
+    def count_iteration(self):
+        self.iterations += 1
+
+        if self.shared_iterations is not None:
+            with self.shared_iterations.get_lock():
+                self.shared_iterations.value += 1
+
+    # the cost of the best tour found so far by this or
+    # any other solver (None if there is none)
+    def incumbent_cost(self):
+        best_cost = self.best_cost
+
+        # a tour found by another solver is as good
+        if self.shared_best_cost is not None:
+            shared_best_cost = self.shared_best_cost.value
+            if best_cost is None or shared_best_cost < best_cost:
+                best_cost = shared_best_cost
+
+        return None if best_cost == INF else best_cost
+
+    # Can a tour through the node be cheaper than the
+    # best one found so far?
+    def can_improve(self, node):
+        best_cost = self.incumbent_cost()
+        return node.bound != INF and \
+            (best_cost is None or node.bound < best_cost)
+
+    # Is a vertex waiting for a solver searching the same
+    # tree in parallel more promising than X? Then this
+    # solver hands its open vertices back, so that the tree
+    # is searched about as best first as by a single one.
+    # It searches at least SUBTREE_MIN_ITERATIONS iterations
+    # before that, as every vertex it is given costs about
+    # as much as that many iterations to rebuild.
+    def has_better_waiting(self):
+        return self.shared_lowest_bound is not None and \
+            self.iterations >= SUBTREE_MIN_ITERATIONS and \
+            self.X.bound > self.shared_lowest_bound.value
+
+    # the open vertices (X and the candidate nodes) which
+    # can still give a better tour
+    def open_nodes(self):
+        return [node for node in [self.X] + sorted(self.candidate_nodes.heap)
+                if self.can_improve(node)]
+
+    # no tour is cheaper than the lowest bound of the
+    # open vertices (X and the candidate nodes)
+    def lowest_bound(self):
+        bound = INF if self.X is None else self.X.bound
+        if self.candidate_nodes.size:
+            bound = min(bound, self.candidate_nodes.get().bound)
+        return bound
+
+    # Is it time to stop the search before the best tour
+    # is found? Sets stopped_by to the reached limit.
+    def limit_reached(self):
+        iterations = self.iterations
+        if self.shared_iterations is not None:
+            iterations = self.shared_iterations.value
+
+        best_cost = self.incumbent_cost()
+
+        if self.node_limit is not None and iterations >= self.node_limit:
+            self.stopped_by = 'node_limit'
+        elif self.deadline is not None and time.time() >= self.deadline:
+            self.stopped_by = 'time_limit'
+        elif self.gap is not None and best_cost is not None and \
+                best_cost + self.forced_cost <= \
+                (1 + self.gap) * (self.lowest_bound() + self.forced_cost):
+            self.stopped_by = 'gap'
+
+        return self.stopped_by is not None
 
+    # --------------------------------------------------
+    # Preprocessing
+    # --------------------------------------------------
 
-def try_add_this_path():
-    global i_from, j_to
-    global current_tour
+    # Before branching, contract the paths which every tour
+    # takes (see find_forced_paths), so that branch and bound
+    # searches a smaller matrix C. result expands the tour
+    # back. Matrices of fewer than 3 cities are solved right
+    # away. Returns False if there is nothing to search (X is
+    # None then).
+    def preprocess(self):
+        tour = Fragments()
 
-    for s_index, sublist in enumerate(current_tour):
-        if i_from == sublist[-1]:
-            return add_path_already_have_i_from(s_index, sublist)
-        elif j_to == sublist[0]:
-            return add_path_already_have_j_to(s_index, sublist)
+        if self.preprocessing:
+            tour, C = find_forced_paths(self.C)
 
-    current_tour.append([i_from, j_to])
-    return True
+            if tour is None:
+                self.debug('Preprocessing: no tour is possible\n')
+                return False
 
+        if len(tour):
+            self.C, self.chains, self.forced_cost = contract_paths(C, tour)
+            self.choose_engine()
+
+            self.debug(f'Preprocessing: forced paths are contracted, '
+                       f'{len(self.input_C)} cities -> {len(self.C)}')
+            self.debug(f'Cities of the contracted matrix: {self.chains}\n')
+            self.debug_M('C', self.C)
+
+        # a single city (not a contracted chain) is
+        # a tour by itself
+        if len(self.input_C) == 1:
+            self.best_tour = [1]
+            self.best_cost = 0
+            return False
+        elif len(self.C) == 1:
+            if self.C[0][0] is not None:
+                self.best_tour = [1]
+                self.best_cost = self.C[0][0]
+            return False
+        elif len(self.C) == 2:
+            tour, cost = dp_tour(self.C)
+            if tour is not None:
+                self.best_tour = tour
+                self.best_cost = cost
+            return False
 
-def add_path(possible_paths):
-    global i_from, j_to
+        return True
 
-    for path in possible_paths:
-        i_from = path[0]
-        j_to = path[1]
+    # --------------------------------------------------
+    # Pruning
+    # --------------------------------------------------
 
-        if try_add_this_path():
-            return True
+    # Once a better tour is found (by this or any other
+    # solver), the candidate nodes which can not give a
+    # better one are removed from the queue, with their
+    # snapshots, so that they (and their ancestors) can be
+    # freed. Returns the number of pruned nodes.
+    def prune_candidates(self):
+        best_cost = self.incumbent_cost()
+        if best_cost is None or best_cost >= self.pruned_with:
+            return 0
 
-    return False
+        self.pruned_with = best_cost
+        pruned = self.candidate_nodes.prune(best_cost)
 
+        for node in pruned:
+            self.snapshots.drop(node)
+            node.anchor = None
 
-# ==============================================================
-# Main program functions: blocks wrapped in DEBUG mode
-# ==============================================================
+        self.pruned += len(pruned)
+        return len(pruned)
 
-def debug_block_1():
-    global C
+    # --------------------------------------------------
+    # Transpositions
+    # --------------------------------------------------
 
-    debug_block_name(1)
-    block_1()
-    debug('Input (distance matrix):\n')
-    debug_M('C', C)
+    # Different vertices can lead to the same problem: the
+    # rest of a tour only depends on the fragments of the
+    # partial tour (their heads and tails, and which cities
+    # are inside them) and on the excluded paths which are
+    # still in the matrix. Of the vertices with the same
+    # state, a tour through the one with the cheapest
+    # included paths is the cheapest, so a vertex is
+    # dropped (its bound set to INF) if a vertex with the
+    # same state was found before with included paths
+    # which do not cost more (or with fewer excluded paths,
+    # a subset of the ones of the vertex). tour is the
+    # partial tour of the node, and row_pos and col_pos are
+    # its matrix'.
+    def is_transposition(self, node, tour):
+        state, excluded, cost = self.transposition_state(node, tour)
+
+        found = self.transposition_table.setdefault(state, [])
+        for found_cost, found_excluded in found:
+            if found_cost <= cost and found_excluded <= excluded:
+                self.transposition_count += 1
+                return True
+
+        found[:] = [(found_cost, found_excluded)
+                    for found_cost, found_excluded in found
+                    if not (cost <= found_cost and excluded <= found_excluded)]
+        found.append((cost, excluded))
+        return False
 
+    # A vertex which is branched stands for its children
+    # from now on. Its descendants excluding paths only
+    # have the same fragments, but more excluded paths, so
+    # it must not make them transpositions.
+    def forget_transposition(self, node, tour):
+        state, excluded, cost = self.transposition_state(node, tour)
+
+        found = self.transposition_table.get(state)
+        if found and (cost, excluded) in found:
+            found.remove((cost, excluded))
+
+    # the state of the node (its fragments and the excluded
+    # paths left in the matrix) and the cost of its
+    # included paths
+    def transposition_state(self, node, tour):
+        excluded = []
+        while node.parent is not None:
+            i, j = node.path
+            if i < 0 and self.row_pos[-i] is not None and \
+                    self.col_pos[-j] is not None:
+                excluded.append((-i, -j))
+            node = node.parent
+
+        state = (frozenset(tour.tail_of.items()), frozenset(tour.succ))
+        cost = sum(self.C[ind(i)][ind(j)] for i, j in tour.succ.items())
+
+        return state, frozenset(excluded), cost
 
-def debug_block_2():
-    global C_prime
-    global X
+    # --------------------------------------------------
+    # Checkpoints
+    # --------------------------------------------------
 
-    debug_block_name(2)
-    block_2()
-    debug(f'Bound(Root) = {X.bound}\n')
-    debug_M('C_prime', C_prime)
+    # Save the state of the search to checkpoint_file: the
+    # open vertices (X and the candidate nodes, none if the
+    # search has finished) with their bounds, and the best
+    # tour so far. block_11 rebuilds the matrix of a vertex
+    # from its paths, so only the tree of the open vertices
+    # and their ancestors is saved. The tree is a list of
+    # [parent, arc] (the parent is an index in the list,
+    # the root being the first one, and the arc is the
+    # packed path, see pack_path), and the open vertices
+    # are [index, bound].
+    def save_checkpoint(self, finished=False):
+        if self.checkpoint_file is None:
+            return
+
+        index = {}
+        tree = []
+
+        def node_index(node):
+            if node not in index:
+                parent = -1
+                if node.parent is not None:
+                    parent = node_index(node.parent)
+                index[node] = len(tree)
+                tree.append([parent, node.arc])
+            return index[node]
+
+        open_nodes = []
+        if not finished:
+            open_nodes = [self.X] + sorted(self.candidate_nodes.heap)
+
+        write_checkpoint(self.checkpoint_file, {
+            'C': self.input_C,
+            # the tree is in the cities of the contracted matrix
+            'preprocessing': self.preprocessing,
+            'best_tour': self.best_tour,
+            'best_cost': self.best_cost,
+            'iterations': self.iterations,
+            'time': time.time() - self.start_time,
+            'tree': tree,
+            'open': [[node_index(node), node.bound] for node in open_nodes]})
+
+        self.next_checkpoint = time.time() + self.checkpoint_interval
+
+    # Start the search from a checkpoint (see
+    # save_checkpoint) like start does from the root.
+    # Returns False if the search had finished already.
+    def resume(self, checkpoint):
+        self.reset(checkpoint['C'])
+        self.preprocessing = checkpoint['preprocessing']
+
+        self.start_time = time.time() - checkpoint['time']
+        self.set_timers()
+
+        self.run_block(1)
+
+        if not self.preprocess():
+            return False
+
+        self.best_tour = checkpoint['best_tour']
+        self.best_cost = checkpoint['best_cost']
+        self.iterations = checkpoint['iterations']
+
+        if self.use_heuristic() and not self.best_tour:
+            self.find_heuristic_tour()
+
+        self.run_block(2)
+
+        nodes = []
+        for parent, arc in checkpoint['tree']:
+            if parent < 0:
+                nodes.append(self.X)
+            else:
+                nodes.append(Node(nodes[parent], unpack_path(arc)))
 
+        open_nodes = checkpoint['open']
+        if not open_nodes:
+            self.X = None
+            return False
 
-def debug_block_3():
-    global i_from, j_to, max_Dij
-    global Y, Y_bar
+        for k, bound in open_nodes:
+            nodes[k].bound = nodes[k].matrix_bound = bound
+            self.candidate_nodes.add(nodes[k])
 
-    debug_block_name(3)
-    new_path_added = block_3()
-    debug(f'Child vertices: '
-          f'Y_bar = ("{Y_bar.path[0]},{Y_bar.path[1]}"), '
-          f'Y = ("{Y.path[0]},{Y.path[1]}")')
-    debug(f'from: i = {i_from}, to: j = {j_to}')
-    debug(f'max_Dij = {max_Dij}\n')
-    if new_path_added:
+        self.X = self.candidate_nodes.pop()
+        self.run_block(11)
         return True
-    else:
-        return False
 
+    # run block_<block_no>, or debug_block_<block_no>
+    # in DEBUG mode
+    def run_block(self, block_no):
+        if self.DEBUG:
+            return getattr(self, f'debug_block_{block_no}')()
+        return getattr(self, f'block_{block_no}')()
 
-def debug_block_4():
-    global i_from, j_to
-    global Y_bar
-
-    debug_block_name(4)
-    block_4()
-    debug(f'Bound("({-i_from},{-j_to})") = {Y_bar.bound}\n')
-
+    # --------------------------------------------------
+    # DEBUG printing functions
+    # --------------------------------------------------
+    def debug(self, text):
+        if self.DEBUG:
+            print(text)
 
-def debug_block_5():
-    global C_prime, i_from, j_to
-    global Y
+    def debug_M(self, matrix_name, M):
+        if self.DEBUG:
+            print_M(matrix_name, M)
 
-    debug_block_name(5)
-    block_5()
-    debug(f'Bound("({i_from},{j_to})") = {Y.bound}\n')
-    debug_M('C_prime', C_prime)
+    def debug_block_name(self, block_no):
+        if self.DEBUG:
+            print('=========================')
+            print(f'Block {block_no} (iteration {self.iterations})')
+            print('=========================\n')
 
+    # --------------------------------------------------
+    # Upper bound
+    # --------------------------------------------------
 
-def debug_block_6():
-    global C_prime
+    # Look for a heuristic tour before branching? By default
+    # only if the search may be stopped early (see
+    # limit_reached), so that a good tour is known at once.
+    # Otherwise it takes more time than it saves: on random
+    # matrices of 10-30 cities it prunes a few iterations
+    # at most, and doubles the time of the small ones.
+    def use_heuristic(self):
+        if self.heuristic is not None:
+            return self.heuristic
+        return self.time_limit is not None or \
+            self.node_limit is not None or self.gap is not None
+
+    # Take the best tour found by heuristics as the best
+    # tour so far. Until the first tour is found by
+    # branching, vertices can then be pruned by block_10.
+    def find_heuristic_tour(self):
+        tour, cost = heuristic_tour(self.C)
+
+        if tour:
+            self.best_tour = tour
+            self.best_cost = cost
+
+            self.debug(f'Heuristic tour: {tour}')
+            self.debug(f'Cost = {cost}\n')
 
-    debug_block_name(6)
-    is_matrix_2x2 = block_6()
-    size = len(C_prime)
+    # --------------------------------------------------
+    # Lower bound
+    # --------------------------------------------------
 
-    if is_matrix_2x2:
-        debug(f'Matrix is simple enough (size = {size}x{size})\n')
-    else:
-        debug(f'Matrix is not simple enough (size = {size}x{size})\n')
+    # The Held-Karp bound of the current vertex, for
+    # symmetric matrices. The fragments of the current
+    # tour are contracted into edges between their heads
+    # and tails, which every tour of this vertex has to
+    # include, so each tour of the vertex is a tour of the
+    # cities left in C_prime (and the fragment ends). Path
+    # i -> j can be used in both directions by such a tour
+    # (its cost is the same), unless both are disabled.
+    #
+    # With without_path, that path is disabled as well
+    # (the bound of Y_bar, while C_prime is the matrix of X).
+    # The penalties found for the last vertex are the
+    # starting point for the next one.
+    def one_tree_bound(self, without_path=None):
+        cities = sorted(set(self.row_map) | set(self.col_map))
+        pos = {city: k for k, city in enumerate(cities)}
+        W = [[INF] * len(cities) for _ in cities]
+
+        A = active_submatrix_inf(self.C_prime, self.row_map, self.col_map)
+        for i, row in zip(self.row_map, A):
+            W_i = W[pos[i]]
+            for j, x in zip(self.col_map, row):
+                if x != INF and (i, j) != without_path:
+                    W_i[pos[j]] = W[pos[j]][pos[i]] = self.C[ind(i)][ind(j)]
+
+        # block_3 has added the path to the current tour already
+        tour = self.current_tour
+        if without_path:
+            tour = tour_without_path(tour, *without_path)
+
+        for head, tail in tour.tail_of.items():
+            W[pos[head]][pos[tail]] = W[pos[tail]][pos[head]] = FORCED
+
+        cost_included_paths = sum(
+            self.C[ind(i)][ind(j)] for i, j in tour.succ.items())
+
+        upper = None
+        best_cost = self.incumbent_cost()
+        if best_cost is not None:
+            upper = best_cost - cost_included_paths
+
+        if self.penalties is None:
+            bound, pi = held_karp_bound(
+                W, [0] * len(cities), upper,
+                ONE_TREE_ROOT_ITERATIONS, 2, ONE_TREE_ROOT_GAP)
+            self.penalties = [0] * len(self.C)
+        else:
+            bound, pi = held_karp_bound(
+                W, [self.penalties[ind(city)] for city in cities], upper,
+                ONE_TREE_ITERATIONS, 1, ONE_TREE_GAP)
+
+        for city, p in zip(cities, pi):
+            self.penalties[ind(city)] = p
+
+        if bound == INF:
+            return INF
+        # the costs are integers
+        return cost_included_paths + math.ceil(bound - 1e-6)
+
+    # Set the bound of the node (a child of X or X itself),
+    # which is the matrix bound unless the one_tree bound
+    # of its vertex is higher
+    def set_bound(self, node, matrix_bound, without_path=None):
+        node.matrix_bound = node.bound = matrix_bound
+
+        if self.one_tree and matrix_bound != INF and len(self.row_map) > 2:
+            node.bound = max(matrix_bound, self.one_tree_bound(without_path))
+            if node.parent is not None and node.parent.bound is not None:
+                node.bound = max(node.bound, node.parent.bound)
+
+    # Set the bound of X after block_11 has corrected its
+    # matrix. Its one_tree bound (if any) is still the same
+    def update_bound_X(self, matrix_bound):
+        if self.one_tree and self.X.bound is not None:
+            self.X.matrix_bound = matrix_bound
+            self.X.bound = max(self.X.bound, matrix_bound)
+        else:
+            self.set_bound(self.X, matrix_bound)
 
-    return is_matrix_2x2
+    # --------------------------------------------------
+    # Functions checking for correctness
+    # --------------------------------------------------
+    def check_tour(self, tour, check_len=True):
+        if check_len:
+            assert len(tour) == len(self.C), \
+                'The tour is shorter than the number of cities'
 
+        assert len(tour) == len(set(tour)), \
+            'There are repeated vertices in the current tour'
 
-def debug_block_7():
-    global Y
-    global current_tour
+    # -----------------------------
+    # For matrix operations
+    # -----------------------------
+    def reset_C_prime(self):
+        if self.C_array is not None:
+            self.C_prime = self.C_array.copy()
+        else:
+            self.C_prime = [row[:] for row in self.C]
+        self.reset_row_col_map()
+
+        self.dirty_rows = set()
+        self.dirty_cols = set()
+
+    # Simplify C_prime and return the sum of subtrahends.
+    #
+    # With incremental=True only the rows and columns which
+    # could have lost their zeros since the last simplification
+    # (dirty_rows, dirty_cols) are simplified, which gives the
+    # same result as simplifying the whole matrix.
+    #
+    # With the assignment (or one_tree) bound, C_prime is
+    # then simplified further by the potentials of the
+    # assignment problem. The bound becomes the cost of the
+    # included paths plus the cost of the best assignment
+    # of the rest, which is never lower than the bound of
+    # the reduction alone.
+    # It is INF if there is no assignment (hence no tour).
+    def simplify_C_prime(self, incremental=False):
+        if incremental:
+            self.C_prime, sum_subtrahends = simplify(
+                self.C_prime, self.row_map, self.col_map,
+                list(self.dirty_rows), list(self.dirty_cols))
+        else:
+            self.C_prime, sum_subtrahends = simplify(
+                self.C_prime, self.row_map, self.col_map)
+
+        if self.bound in ('assignment', 'one_tree'):
+            self.C_prime, sum_assignment = simplify_by_assignment(
+                self.C_prime, self.row_map, self.col_map)
+            sum_subtrahends += sum_assignment
+
+        self.dirty_rows = set()
+        self.dirty_cols = set()
+
+        return sum_subtrahends
+
+    # remember rows (columns) which have a zero in the
+    # given column (row): they can lose their only zero
+    def mark_lost_zeros(self, i_row, j_col):
+        row = self.C_prime[ind(i_row)]
+        self.dirty_rows.update(
+            i for i in self.row_map if self.C_prime[ind(i)][ind(j_col)] == 0)
+        self.dirty_cols.update(
+            j for j in self.col_map if row[ind(j)] == 0)
+
+    # get the active part of C_prime (for printing)
+    def active_C_prime(self):
+        if is_array(self.C_prime):
+            return self.C_prime[active_block(self.row_map, self.col_map)]
+        return active_submatrix(self.C_prime, self.row_map, self.col_map)
+
+    # row_pos[i] (col_pos[j]) is the position of the i-th row
+    # (j-th column) in row_map (col_map), or None if it was
+    # deleted. Index 0 is not used.
+    def reset_row_col_map(self):
+        self.row_map = [i for i in range(1, len(self.C_prime) + 1)]
+        self.col_map = [i for i in range(1, len(self.C_prime) + 1)]
+
+        self.row_pos = [None] + [i for i in range(len(self.C_prime))]
+        self.col_pos = [None] + [i for i in range(len(self.C_prime))]
+
+    # C_prime is not copied: the i-th row and j-th column
+    # are only removed from the active rows and columns
+    def delete_row_col(self, i_row, j_col):
+        self.mark_lost_zeros(i_row, j_col)
+        self.dirty_rows.discard(i_row)
+        self.dirty_cols.discard(j_col)
+
+        self.fix_map_on_delete(i_row, j_col)
+
+    def fix_map_on_delete(self, row_from_map, col_from_map):
+        remove_from_map(self.row_map, self.row_pos, row_from_map)
+        remove_from_map(self.col_map, self.col_pos, col_from_map)
+
+    def disable_path(self, i_row, j_col):
+        if self.row_pos[i_row] is not None and self.col_pos[j_col] is not None:
+            if self.C_prime[ind(i_row)][ind(j_col)] == 0:
+                self.dirty_rows.add(i_row)
+                self.dirty_cols.add(j_col)
+
+            set_inf(self.C_prime, i_row, j_col)
 
-    debug_block_name(7)
-    block_7()
-    debug(f'Current tour: {current_tour}')
-    debug(f'Bound("Y_last") = {Y.bound} ( = cost of this tour)\n')
+    # -----------------------------
+    # For choosing the path to branch on
+    # -----------------------------
 
+    # choose one of the paths with the largest D[i,j]
+    # (see BRANCHING_RULES)
+    def choose_path(self, possible_paths):
+        if len(possible_paths) == 1 and self.branching != 'strong':
+            return possible_paths[0]
+
+        if self.branching == 'cost':
+            return min(possible_paths,
+                       key=lambda path: self.C[ind(path[0])][ind(path[1])])
+        elif self.branching == 'fragment':
+            return max(possible_paths,
+                       key=lambda path: self.current_tour.joined_length(*path))
+        elif self.branching == 'strong':
+            return self.strong_branching_path()
+
+        return possible_paths[0]
+
+    # Try the paths with the largest D[i,j] (strong_candidates
+    # of them): the bound of Y_bar grows by D[i,j] (or by the
+    # change of the assignment bound), and the bound of Y by
+    # the sum of subtrahends after adding the path, which is
+    # found on a copy of the matrix. Sets max_Dij to D[i,j]
+    # of the chosen path, for block_4.
+    def strong_branching_path(self):
+        D_paths = sorted(find_Dij(self.C_prime, self.row_map, self.col_map),
+                         key=lambda D_path: -D_path[0])
+        D_paths = D_paths[:self.strong_candidates]
+
+        if len(D_paths) == 1:
+            return D_paths[0][1:]
+
+        state = Snapshot(None, self.C_prime, self.row_map, self.col_map,
+                         self.current_tour, self.dirty_rows, self.dirty_cols)
+        best = None
+
+        for D_ij, i, j in D_paths:
+            if self.bound in ('assignment', 'one_tree'):
+                increase_Y_bar = assignment_cost_without_path(
+                    state.C_prime, state.row_map, state.col_map, i, j)
+            else:
+                increase_Y_bar = D_ij
 
-def debug_block_8():
-    global best_tour, best_cost
+            self.restore_snapshot(state, copy=True)
+            closing_path = self.current_tour.add(i, j)
+            self.delete_row_col(i, j)
+            self.disable_path(*closing_path)
+            increase_Y = self.simplify_C_prime(incremental=True)
 
-    debug_block_name(8)
-    old_best_cost = best_cost
+            score = (min(increase_Y_bar, increase_Y),
+                     max(increase_Y_bar, increase_Y))
+            if best is None or score > best[0]:
+                best = (score, D_ij, i, j)
 
-    block_8()
+        self.restore_snapshot(state)
+        self.max_Dij = best[1]
 
-    if best_cost != old_best_cost:
-        debug(f'Better tour has been found: {best_tour}\n')
-    else:
-        debug(
-            f'We did not find a better tour. Best tour so far: {best_tour}\n')
+        return best[2:]
 
+    # -----------------------------
+    # For node snapshots
+    # -----------------------------
 
-def debug_block_9():
-    global X
+    # Y_bar has the matrix of X without path i -> j and
+    # the tour of X (the current tour without i -> j)
+    def save_snapshot_Y_bar(self):
+        M = copy_matrix(self.C_prime)
+        set_inf(M, self.i_from, self.j_to)
+
+        self.snapshots.add(self.Y_bar, Snapshot(
+            self.X.matrix_bound, M, self.row_map[:], self.col_map[:],
+            tour_without_path(self.current_tour, self.i_from, self.j_to),
+            self.dirty_rows | {self.i_from}, self.dirty_cols | {self.j_to}))
+
+    # Y is put back to the candidate nodes with the current
+    # matrix. C_prime is replaced (not changed) by block_11
+    # afterwards, so nothing has to be copied
+    def save_snapshot_Y(self):
+        self.snapshots.add(self.Y, Snapshot(
+            self.Y.matrix_bound, self.C_prime, self.row_map, self.col_map,
+            self.current_tour, self.dirty_rows, self.dirty_cols))
+
+    # Every snapshot_depth-th level of the tree, the matrix
+    # of X is saved before branching. The snapshot is passed
+    # on to the descendants of X, so block_11 can rebuild them
+    # starting from it instead of the root. It is freed when
+    # no vertex needs it any more.
+    def save_anchor(self):
+        if self.snapshot_depth and self.X.depth % self.snapshot_depth == 0:
+            self.X.anchor = Snapshot(
+                self.X.matrix_bound, copy_matrix(self.C_prime),
+                self.row_map[:], self.col_map[:], self.current_tour.copy(),
+                set(self.dirty_rows), set(self.dirty_cols), depth=self.X.depth)
+
+    # continue from the saved state (the snapshot is
+    # copied if it can be used again)
+    def restore_snapshot(self, snapshot, copy=False):
+        if copy:
+            self.C_prime = copy_matrix(snapshot.C_prime)
+            self.row_map = snapshot.row_map[:]
+            self.col_map = snapshot.col_map[:]
+            self.current_tour = snapshot.current_tour.copy()
+        else:
+            self.C_prime = snapshot.C_prime
+            self.row_map = snapshot.row_map
+            self.col_map = snapshot.col_map
+            self.current_tour = snapshot.current_tour
 
-    debug_block_name(9)
-    block_9()
-    i, j = X.path[0], X.path[1]
-    debug(f'Next vertex: X = ("{i},{j}")')
-    debug(f'Bound("({i},{j})") = {X.bound}\n')
+        self.row_pos = [None] * (len(self.C_prime) + 1)
+        self.col_pos = [None] * (len(self.C_prime) + 1)
+        for index, i in enumerate(self.row_map):
+            self.row_pos[i] = index
+        for index, j in enumerate(self.col_map):
+            self.col_pos[j] = index
 
+        self.dirty_rows = set(snapshot.dirty_rows)
+        self.dirty_cols = set(snapshot.dirty_cols)
 
-def debug_block_10():
-    global X
-    global best_tour, best_cost
+    # --------------------------------------------------
+    # Blocks wrapped in DEBUG mode
+    # --------------------------------------------------
 
-    debug_block_name(10)
-    is_no_better_path = block_10()
+    def debug_block_1(self):
+        self.debug_block_name(1)
+        self.block_1()
+        self.debug('Input (distance matrix):\n')
+        self.debug_M('C', self.C)
+
+        if self.bound == 'one_tree' and not self.one_tree:
+            self.debug('The matrix is not symmetric, so the one_tree bound '
+                       'is not used\n')
+
+    def debug_block_2(self):
+        self.debug_block_name(2)
+        self.block_2()
+        self.debug(f'Bound(Root) = {self.X.bound}\n')
+        self.debug_M('C_prime', self.active_C_prime())
+
+    def debug_block_3(self):
+        self.debug_block_name(3)
+        new_path_added = self.block_3()
+        if new_path_added:
+            Y_bar, Y = self.Y_bar, self.Y
+            self.debug(f'Child vertices: '
+                       f'Y_bar = ("{Y_bar.path[0]},{Y_bar.path[1]}"), '
+                       f'Y = ("{Y.path[0]},{Y.path[1]}")')
+            self.debug(f'from: i = {self.i_from}, to: j = {self.j_to}')
+            self.debug(f'max_Dij = {self.max_Dij}\n')
+            return True
+        else:
+            self.debug('No path can be added, the vertex is dropped\n')
+            return False
+
+    def debug_block_4(self):
+        self.debug_block_name(4)
+        self.block_4()
+        i, j = self.i_from, self.j_to
+        self.debug(f'Bound("({-i},{-j})") = {self.Y_bar.bound}\n')
+
+    def debug_block_5(self):
+        self.debug_block_name(5)
+        self.block_5()
+        self.debug(f'Bound("({self.i_from},{self.j_to})") = {self.Y.bound}\n')
+        self.debug_M('C_prime', self.active_C_prime())
+
+    def debug_block_6(self):
+        self.debug_block_name(6)
+        is_matrix_2x2 = self.block_6()
+        size = len(self.row_map)
+
+        if is_matrix_2x2:
+            self.debug(f'Matrix is simple enough (size = {size}x{size})\n')
+        else:
+            self.debug(f'Matrix is not simple enough (size = {size}x{size})\n')
+
+        return is_matrix_2x2
+
+    def debug_block_7(self):
+        self.debug_block_name(7)
+        if not self.block_7():
+            self.debug(f'No tour goes through Y, some of its paths '
+                       f'are missing: {self.current_tour}\n')
+            return
+        self.debug(f'Current tour: {self.current_tour}')
+        self.debug(f'Bound("Y_last") = {self.Y.bound} '
+                   f'( = cost of this tour)\n')
+
+    def debug_block_8(self):
+        self.debug_block_name(8)
+        old_best_cost = self.best_cost
+        old_pruned = self.pruned
+
+        self.block_8()
+
+        if self.best_cost != old_best_cost:
+            self.debug(f'Better tour has been found: {self.best_tour}\n')
+            if self.pruned != old_pruned:
+                self.debug(f'Candidate vertices which can not give a '
+                           f'better tour have been pruned: '
+                           f'{self.pruned - old_pruned}\n')
+        else:
+            self.debug(f'We did not find a better tour. '
+                       f'Best tour so far: {self.best_tour}\n')
+
+    def debug_block_9(self):
+        self.debug_block_name(9)
+        self.block_9()
+        i, j = self.X.path[0], self.X.path[1]
+        self.debug(f'Next vertex: X = ("{i},{j}")')
+        self.debug(f'Bound("({i},{j})") = {self.X.bound}\n')
+
+    def debug_block_10(self):
+        self.debug_block_name(10)
+        is_no_better_path = self.block_10()
+
+        if is_no_better_path:
+            self.debug('The next chosen vertex does not contain the better '
+                       'tour than we already have. The algorithm stops '
+                       'here.\n')
+        else:
+            best_tour_bound = 'infinity'
+            if len(self.best_tour):
+                best_tour_bound = f'{self.best_cost}'
+
+            self.debug(f'The next chosen vertex has a smaller lower bound '
+                       f'(bound >= {self.X.bound}) than the cost of the '
+                       f'current best tour (cost = {best_tour_bound}).')
+            self.debug('Hence the algorithm proceeds.\n')
+
+        return is_no_better_path
+
+    def debug_block_11(self):
+        self.debug_block_name(11)
+        is_vertex_the_same = self.block_11()
+
+        if is_vertex_the_same:
+            self.debug('Same vertex has been picked as it was before,'
+                       ' the matrix C_prime does not change.\n')
+            self.debug_M('C_prime', self.active_C_prime())
+            self.debug('The bound of X is:')
+            i, j = self.X.path[0], self.X.path[1]
+            self.debug(f'Bound("({i},{j})") = {self.X.bound}\n')
+        else:
+            self.debug('Matrix has been corrected. It is now:\n')
+            self.debug_M('C_prime', self.active_C_prime())
 
-    if is_no_better_path:
-        debug('The next chosen vertex does not contain the better tour '
-              'than we already have. The algorithm stops here.\n')
-    else:
-        best_tour_bound = 'infinity'
-        if len(best_tour):
-            best_tour_bound = f'{best_cost}'
+            self.debug('The bound of X has been updated. It is now:')
+            i, j = self.X.path[0], self.X.path[1]
+            self.debug(f'Bound("({i},{j})") = {self.X.bound}\n')
 
-        debug(f'The next chosen vertex has a smaller lower bound '
-              f'(bound >= {X.bound}) than the cost of the current '
-              f'best tour (cost = {best_tour_bound}).')
-        debug('Hence the algorithm proceeds.\n')
+    # --------------------------------------------------
+    # Block 1: Input data
+    # --------------------------------------------------
 
-    return is_no_better_path
+    def block_1(self):
+        # convert 0s to None, meaning INF
+        C_tmp = []
+        for row in self.C:
+            C_tmp.append([None if x == 0 else x for x in row])
 
+        self.C = C_tmp
 
-def debug_block_11():
-    global C_prime
-    global X
+        self.input_C = self.C
+        self.choose_engine()
 
-    debug_block_name(11)
-    is_vertex_the_same = block_11()
+    # the one_tree bound (which is for symmetric matrices)
+    # and the matrix engine for C
+    def choose_engine(self):
+        self.one_tree = self.bound == 'one_tree' and is_symmetric(self.C)
 
-    if is_vertex_the_same:
-        debug('Same vertex has been picked as it was before,'
-              ' the matrix C_prime does not change.\n')
-        debug_M('C_prime', C_prime)
-        debug('The bound of X is:')
-        i, j = X.path[0], X.path[1]
-        debug(f'Bound("({i},{j})") = {X.bound}\n')
-    else:
-        debug('Matrix has been corrected. It is now:\n')
-        debug_M('C_prime', C_prime)
+        self.C_array = None
+        if self.ENGINE == 'numpy' or \
+                (self.ENGINE == 'auto' and np is not None
+                 and len(self.C) >= ARRAY_ENGINE_MIN_SIZE):
+            self.C_array = np.array(
+                [[INF if x is None else x for x in row] for row in self.C],
+                dtype=float)
 
-        debug('The bound of X has been updated. It is now:')
-        i, j = X.path[0], X.path[1]
-        debug(f'Bound("({i},{j})") = {X.bound}\n')
+    # --------------------------------------------------
+    # Block 2: Matrix simplification and finding the
+    #          bound of the root vertex
+    # --------------------------------------------------
 
+    def block_2(self):
+        self.reset_C_prime()
+        bound_root = self.simplify_C_prime()
+        self.X = Node(None, (None, None))
+        self.set_bound(self.X, bound_root)
 
-# ==============================================================
-# Main program functions: blocks
-# ==============================================================
+    # --------------------------------------------------
+    # Block 3: Choosing the next vertex "(i,j)" for
+    #          branching
+    # --------------------------------------------------
 
-# --------------------------------------------------
-# Block 1: Input data
-# --------------------------------------------------
+    def block_3(self):
+        # reset these variables
+        self.i_from = None
+        self.j_to = None
+        self.max_Dij = None
 
-def block_1():
-    global C
+        self.save_anchor()
 
-    # convert 0s to None, meaning INF
-    C_tmp = []
-    for row in C:
-        C_tmp.append([None if x == 0 else x for x in row])
+        if self.transpositions:
+            self.forget_transposition(self.X, self.current_tour)
 
-    C = C_tmp
+        # calculate the change of bound for all
+        # elements in the matrix whose value is 0
+        possible_paths, self.max_Dij = find_max_Dij(
+            self.C_prime, self.row_map, self.col_map)
 
+        if not possible_paths:
+            return False
 
-# --------------------------------------------------
-# Block 2: Matrix simplification and finding the
-#          bound of the root vertex
-# --------------------------------------------------
+        self.i_from, self.j_to = self.choose_path(possible_paths)
 
-def block_2():
-    global C, C_prime, row_map, col_map
-    global X
+        # the paths which would close a cycle are
+        # disabled (see block_5), so this one can
+        # always be added
+        self.closing_path = self.current_tour.add(self.i_from, self.j_to)
 
-    reset_C_prime()
-    C_prime, bound_root = simplify(C_prime)
-    X = Node(None, (None, None), bound=bound_root)
+        if self.closing_path is None:
+            raise Exception(
+                f'Something went wrong, path {self.i_from} -> {self.j_to} '
+                f'closes a cycle\n')
 
+        self.Y_bar = Node(self.X, (-self.i_from, -self.j_to))
+        self.Y = Node(self.X, (self.i_from, self.j_to))
 
-# --------------------------------------------------
-# Block 3: Choosing the next vertex "(i,j)" for
-#          branching
-# --------------------------------------------------
+        # X is branched, only its children need the anchor
+        self.Y_bar.anchor = self.Y.anchor = self.X.anchor
+        self.X.anchor = None
 
-def block_3():
-    global C_prime, i_from, j_to, max_Dij
-    global X, Y, Y_bar
-    global current_tour
+        return True
 
-    # reset these global variables
-    i_from = None
-    j_to = None
-    max_Dij = None
+    # --------------------------------------------------
+    # Block 4: Branching - finding the bound of the
+    #          vertex "(i,j)_bar"
+    # --------------------------------------------------
 
-    # calculate the change of bound for all
-    # elements in the matrix whose value is 0
-    possible_paths, max_Dij = find_max_Dij(C_prime)
+    def block_4(self):
+        if self.bound in ('assignment', 'one_tree'):
+            bound = self.X.matrix_bound + assignment_cost_without_path(
+                self.C_prime, self.row_map, self.col_map,
+                self.i_from, self.j_to)
+        else:
+            bound = self.X.matrix_bound + self.max_Dij
 
-    if not possible_paths:
-        return False
+        self.set_bound(self.Y_bar, bound, (self.i_from, self.j_to))
 
-    i_from = possible_paths[0][0]
-    j_to = possible_paths[0][1]
+        if self.transpositions and self.is_transposition(
+                self.Y_bar, tour_without_path(
+                    self.current_tour, self.i_from, self.j_to)):
+            self.Y_bar.bound = INF
 
-    if not current_tour:
-        current_tour.append([i_from, j_to])
-    else:
-        while not add_path(possible_paths):
-            C_prime[row_map.index(i_from)][col_map.index(j_to)] = None
-            possible_paths, max_Dij = find_max_Dij(C_prime)
+        # no better tour goes through Y_bar, so it would
+        # only take memory in the queue
+        if not self.can_improve(self.Y_bar):
+            self.Y_bar.anchor = None
+            return
 
-            if not possible_paths:
-                return False
+        # we always check Y first, so let's save
+        # Y_bar for later
+        self.candidate_nodes.add(self.Y_bar)
 
-            i_from = possible_paths[0][0]
-            j_to = possible_paths[0][1]
+        if self.snapshots.budget:
+            self.save_snapshot_Y_bar()
 
-    check_tour(current_tour, check_len=False, flatten=True)
+    # --------------------------------------------------
+    # Block 5: Branching - finding the bound of
+    #          the vertex "(i,j)"
+    # --------------------------------------------------
 
-    Y_bar = Node(X, (-i_from, -j_to))
-    Y = Node(X, (i_from, j_to))
+    def block_5(self):
+        self.delete_row_col(self.i_from, self.j_to)
+        # forbid the path which would close the
+        # fragment that i -> j was added to
+        self.disable_path(*self.closing_path)
+        sum_subtrahends = self.simplify_C_prime(incremental=True)
 
-    X.left_child = Y_bar
-    X.right_child = Y
+        self.set_bound(self.Y, self.X.matrix_bound + sum_subtrahends)
 
-    return True
+        if self.transpositions and \
+                self.is_transposition(self.Y, self.current_tour):
+            self.Y.bound = INF
 
+        # reset X
+        self.X = None
 
-# --------------------------------------------------
-# Block 4: Branching - finding the bound of the
-#          vertex "(i,j)_bar"
-# --------------------------------------------------
+    # --------------------------------------------------
+    # Block 6: Is the distance matrix small enough?
+    # --------------------------------------------------
 
-def block_4():
-    global max_Dij
-    global X, Y_bar
-    global candidate_nodes
+    # check matrix dimensions (a vertex without
+    # tours is never simple enough)
+    def block_6(self):
+        return len(self.row_map) == 2 and self.Y.bound != INF
 
-    Y_bar.bound = X.bound + max_Dij
-    # we always check Y first, so let's save
-    # Y_bar for later
-    candidate_nodes.add(Y_bar)
+    # --------------------------------------------------
+    # Block 7: Exhaustive estimation of the remaining
+    #          matrix
+    # --------------------------------------------------
 
+    def block_7(self):
+        if len(self.current_tour) not in (1, 2):
+            raise Exception(
+                f'Something went wrong, there should only be 1 or 2 sublists'
+                f' at the end when matrix size is 2x2, '
+                f'got {len(self.current_tour)}')
 
-# --------------------------------------------------
-# Block 5: Branching - finding the bound of
-#          the vertex "(i,j)"
-# --------------------------------------------------
+        possible_paths_pair_1 = [[self.row_map[0], self.col_map[0]],
+                                 [self.row_map[1], self.col_map[1]]]
 
-def block_5():
-    global C_prime, i_from, j_to
-    global X, Y
+        possible_paths_pair_2 = [[self.row_map[0], self.col_map[1]],
+                                 [self.row_map[1], self.col_map[0]]]
 
-    delete_row_col(i_from, j_to)
-    disable_path(j_to, i_from)
-    C_prime, sum_subtrahends = simplify(C_prime)
+        # Either pair of paths can give a tour (the other
+        # one closes a cycle). With paths missing from C
+        # (sparse matrices), neither of them may.
+        best_paths = None
+        best_cost = INF
 
-    Y.bound = X.bound + sum_subtrahends
+        for possible_paths in [possible_paths_pair_1, possible_paths_pair_2]:
+            tour = self.current_tour.copy()
 
-    # reset X
-    X = None
+            # the first path which can be added joins the
+            # fragments, and the other one closes the tour
+            for i, j in possible_paths:
+                if tour.add(i, j):
+                    break
 
+            if len(tour) > 1:
+                continue
 
-# --------------------------------------------------
-# Block 6: Is the distance matrix small enough?
-# --------------------------------------------------
+            paths = tour.sublists()[0]
+            self.check_tour(paths)
 
-# check matrix dimensions
-def block_6():
-    global C_prime
-    return len(C_prime) == 2
+            cost = 0
+            for k in range(len(paths)):
+                path_cost = self.C[ind(paths[k - 1])][ind(paths[k])]
+                cost += INF if path_cost is None else path_cost
 
+            if best_paths is None or cost < best_cost:
+                best_paths = paths
+                best_cost = cost
 
-# --------------------------------------------------
-# Block 7: Exhaustive estimation of the remaining
-#          matrix
-# --------------------------------------------------
+        if best_paths is None:
+            raise Exception(
+                f'Something went wrong, no path was not added '
+                f'at the last stage, when matrix size is 2x2\n')
 
-def block_7():
-    global C, row_map, col_map
-    global Y
-    global current_tour
+        self.current_tour = best_paths
+        self.Y.bound = best_cost
 
-    cost = 0
+        # no tour goes through Y
+        return best_cost != INF
 
-    if len(current_tour) == 2:
-        paths = current_tour[0] + current_tour[1]
-    elif len(current_tour) == 1:
-        possible_paths_pair_1 = [[row_map[0], col_map[0]],
-                                 [row_map[1], col_map[1]]]
+    # --------------------------------------------------
+    # Block 8: Is bound_Y_last < best_cost? If yes, save
+    #          the current tour as the best so far
+    # --------------------------------------------------
 
-        possible_paths_pair_2 = [[row_map[0], col_map[1]],
-                                 [row_map[1], col_map[0]]]
+    def block_8(self):
+        cost = self.Y.bound
+        if cost == INF:
+            return
 
-        current = current_tour.copy()
+        if self.best_cost is None or cost < self.best_cost:
+            self.best_cost = cost
+            self.best_tour = self.current_tour
 
-        path_added = add_path(possible_paths_pair_1)
+            if self.shared_best_cost is not None:
+                with self.shared_best_cost.get_lock():
+                    if cost < self.shared_best_cost.value:
+                        self.shared_best_cost.value = cost
 
-        if not path_added or len(current_tour) > 1:
-            current_tour = current
+        self.prune_candidates()
 
-            path_added = add_path(possible_paths_pair_2)
+    # --------------------------------------------------
+    # Block 9: Choose the next vertex
+    # --------------------------------------------------
 
-            if not path_added:
-                raise Exception(
-                    f'Something went wrong, no path was not added '
-                    f'at the last stage, when matrix size is 2x2\n')
+    def block_9(self):
+        self.X = self.Y
 
-        paths = current_tour[0]
-    else:
-        raise Exception(
-            f'Something went wrong, there should only be 1 or 2 sublists'
-            f' at the end when matrix size is 2x2, got {len(current_tour)}')
+        # go deeper if Y can still give a better tour,
+        # the candidate nodes wait
+        if self.depth_first() and len(self.row_map) > 2 and \
+                self.can_improve(self.Y):
+            return
 
-    check_tour(paths)
+        if self.candidate_nodes.size and \
+                self.Y.bound > self.candidate_nodes.get().bound:
+            self.X = self.candidate_nodes.pop()
+            if len(self.row_map) > 2 and self.Y.bound != INF:
+                self.candidate_nodes.add(self.Y)
 
-    for i in range(len(paths[:-1])):
-        cost += C[ind(paths[i])][ind(paths[i + 1])]
-    cost += C[ind(paths[-1])][ind(paths[0])]
+                if self.snapshots.budget:
+                    self.save_snapshot_Y()
+            else:
+                self.Y.anchor = None
 
-    current_tour = paths
-    Y.bound = cost
+    # Is Y chosen even if some candidate node has a
+    # lower bound? (see STRATEGIES)
+    def depth_first(self):
+        return self.strategy == 'depth_first' or \
+            (self.strategy == 'hybrid' and
+             self.candidate_nodes.size > self.queue_limit)
 
+    # --------------------------------------------------
+    # Block 10: Do we have the best tour already?
+    # --------------------------------------------------
 
-# --------------------------------------------------
-# Block 8: Is bound_Y_last < best_cost? If yes, save
-#          the current tour as the best so far
-# --------------------------------------------------
+    def block_10(self):
+        best_cost = self.incumbent_cost()
 
-def block_8():
-    global Y
-    global current_tour, best_tour, best_cost
+        if best_cost is not None and best_cost <= self.X.bound:
+            return True
+        # no tour goes through X, nor any other vertex
+        elif self.X.bound == INF:
+            return True
+        else:
+            return False
 
-    cost = Y.bound
-    if best_cost is None or cost < best_cost:
-        best_cost = cost
-        best_tour = current_tour
+    # --------------------------------------------------
+    # Block 11: Correct matrix for current vertex X
+    # --------------------------------------------------
 
+    def block_11(self):
+        # Is the next chosen vertex X the same as
+        # the curent vertex Y?
+        if self.X == self.Y:
+            # C_prime does not change, it's the same
+            # that we need
+            return True
 
-# --------------------------------------------------
-# Block 9: Choose the next vertex
-# --------------------------------------------------
+        # Was the matrix of X saved?
+        if self.X.snapshot is not None:
+            snapshot = self.snapshots.take(self.X)
+            self.restore_snapshot(snapshot)
+            self.update_bound_X(
+                snapshot.base_bound + self.simplify_C_prime(incremental=True))
+            return False
+
+        # Start either from the closest ancestor whose
+        # matrix was saved, or from the root
+        anchor = self.X.anchor
+
+        if anchor is not None:
+            self.restore_snapshot(anchor, copy=True)
+            base_bound = anchor.base_bound
+            depth = anchor.depth
+        else:
+            # reset these variables
+            self.reset_C_prime()
+            self.current_tour = Fragments()
+            base_bound = 0
+            depth = 0
 
-def block_9():
-    global C_prime
-    global X, Y
-    global candidate_nodes
+        # traversing the tree
+        node = self.X
+        cost_included_paths = 0
 
-    X = Y
+        while node.depth > depth:
 
-    if Y.bound > candidate_nodes.get().bound:
-        X = candidate_nodes.pop()
-        if len(C_prime) > 2:
-            candidate_nodes.add(Y)
+            self.i_from = node.path[0]
+            self.j_to = node.path[1]
 
+            if self.i_from < 0 and self.j_to < 0:
+                self.disable_path(-self.i_from, -self.j_to)
+            else:
+                self.closing_path = \
+                    self.current_tour.add(self.i_from, self.j_to)
 
-# --------------------------------------------------
-# Block 10: Do we have the best tour already?
-# --------------------------------------------------
+                if self.closing_path is None:
+                    raise Exception(
+                        f'Something went wrong, no path was added\n')
 
-def block_10():
-    global X
-    global best_tour, best_cost
+                # the cost of the path in the matrix we started
+                # from (C itself if we started from the root)
+                cost_included_paths += \
+                    int(self.C_prime[ind(self.i_from)][ind(self.j_to)])
 
-    if best_cost is not None and best_cost <= X.bound:
-        # make the tour start from city no. 1
-        index_of_1 = best_tour.index(1)
-        best_tour = best_tour[index_of_1:] + best_tour[:index_of_1]
-        return True
-    else:
-        return False
+                self.delete_row_col(self.i_from, self.j_to)
+                self.disable_path(*self.closing_path)
 
+            node = node.parent
 
-# --------------------------------------------------
-# Block 11: Correct matrix for current vertex X
-# --------------------------------------------------
+        # the saved matrix was already simplified
+        sum_subtrahends = self.simplify_C_prime(incremental=anchor is not None)
 
-def block_11():
-    global C, C_prime, row_map, col_map, i_from, j_to
-    global X, Y
-    global current_tour
+        # adjust bound(X) value
+        self.update_bound_X(base_bound + cost_included_paths + sum_subtrahends)
 
-    # Is the next chosen vertex X the same as
-    # the curent vertex Y?
-    if X == Y:
-        # C_prime does not change, it's the same
-        # that we need
-        return True
+        return False
 
-    # reset these global variables
-    reset_C_prime()
-    current_tour = []
 
-    # traversing the tree
-    node = X
-    cost_included_paths = 0
+# ==============================================================
+# Parallel branch and bound
+# ==============================================================
 
-    while node.parent is not None:
+# The search is split between the processes when there
+# are this many open vertices for every process (see
+# solve_parallel)
+SPLIT_VERTICES_PER_JOB = 4
 
-        i_from = node.path[0]
-        j_to = node.path[1]
+# the number of iterations a process searches the subtree
+# of its vertex before it may hand the open vertices back
+# (see TSPSolver.has_better_waiting)
+SUBTREE_MIN_ITERATIONS = 50
 
-        if i_from < 0 and j_to < 0:
-            if -i_from in row_map and -j_to in col_map:
-                C_prime[row_map.index(-i_from)][col_map.index(-j_to)] = None
-        else:
-            if not current_tour:
-                current_tour.append([i_from, j_to])
-            else:
-                path_added = add_path([[node.path[0], node.path[1]]])
-                if not path_added:
-                    raise Exception(
-                        f'Something went wrong, no path was added\n')
+# the limits which are the same for all processes, so a
+# process stopped by one of them stops the whole search
+# (a reason found in one subtree only is not enough)
+SHARED_LIMITS = ('node_limit', 'time_limit')
 
-            cost_included_paths += C[ind(i_from)][ind(j_to)]
+# state of a worker process (see init_worker)
+worker = {}
 
-            delete_row_col(i_from, j_to)
-            disable_path(j_to, i_from)
 
+# paths from the root to the node, which define it
+def node_paths(node):
+    paths = []
+    while node.parent is not None:
+        paths.append(node.path)
         node = node.parent
+    return paths[::-1]
+
+
+# The solver of a worker process preprocesses C and
+# simplifies the root once, so that every vertex it gets
+# is rebuilt from the saved root (see TSPSolver.restart).
+# The heuristic tour is already shared by the main
+# process, and the time limit is the same for all
+# processes (they stop at the deadline). The gap is
+# checked by the main process only, as the lowest bound
+# of a subtree says nothing about the other subtrees.
+def init_worker(C, solver_options, shared_best_cost, shared_iterations,
+                shared_lowest_bound, shared_stop, deadline):
+    solver = TSPSolver(**dict(
+        solver_options, heuristic=False, gap=None,
+        shared_best_cost=shared_best_cost,
+        shared_iterations=shared_iterations,
+        shared_lowest_bound=shared_lowest_bound, shared_stop=shared_stop))
+    solver.start(C)
+    solver.save_root()
+
+    worker['deadline'] = deadline
+    worker['solver'] = solver
+
+
+# Search the subtree of the vertex given by its paths from
+# the root. If a waiting vertex becomes more promising
+# than the next one of the subtree, or the main process
+# stops the search, the search stops, and the open
+# vertices of the subtree (paths and bounds) are handed
+# back to the main process together with the result.
+def solve_subproblem(paths):
+    solver = worker['solver']
+    if worker['deadline'] is not None:
+        solver.time_limit = worker['deadline'] - time.time()
+    solver.restart(paths)
+
+    finished = solver.block_10() or solver.search()
+
+    open_nodes = []
+    if not finished and not solver.stopped_by:
+        open_nodes = [(node_paths(node), node.bound)
+                      for node in solver.open_nodes()]
+
+    return solver.result() + (open_nodes,)
+
+
+# Solve TSP like TSPSolver.solve, in the given number of
+# processes. The tree is searched as usual until there
+# are enough open vertices. Then the subtrees of the open
+# vertices are searched by the processes, the most
+# promising ones first. The cost of the best tour found
+# so far is shared between the processes, so each of them
+# stops as soon as its vertices can not give a better one.
+# With the best first strategies, the lowest bound of the
+# waiting vertices is shared too: a process hands its open
+# vertices back as soon as its next vertex is less
+# promising, so the processes expand about the same
+# vertices as a single one would. The gap is checked
+# against the lowest bound of all waiting vertices and
+# running subtrees here, not by the processes.
+#
+# A process preprocesses C and simplifies the root only
+# once, rebuilds every vertex it gets from the saved root,
+# and searches its subtree for at least
+# SUBTREE_MIN_ITERATIONS iterations. An iteration then
+# takes about the CPU time of one by a single solver
+# (30-40 cities), so even on a single processor -j 2 is
+# not slower than a single solver.
+def solve_parallel(C, jobs, solver_options):
+    start_time = time.time()
+
+    solver = TSPSolver(**solver_options)
+    if solver.use_dp(C):
+        return solver.solve(C)
+
+    solver.start(C)
+    if solver.search(max_open=jobs * SPLIT_VERTICES_PER_JOB) or \
+            solver.stopped_by:
+        return solver.result()
+
+    # the vertices waiting for a process, the most
+    # promising first (the counter keeps equal bounds
+    # in the order they came)
+    counter = itertools.count()
+    waiting = [(node.bound, next(counter), node_paths(node))
+               for node in solver.open_nodes()]
+    heapq.heapify(waiting)
+
+    # the processes share the cost and the bounds in the
+    # (possibly contracted, see preprocess) matrix they
+    # search
+    shared_best_cost = multiprocessing.Value(
+        'd', INF if solver.best_cost is None else solver.best_cost)
+    shared_lowest_bound = None
+    if solver.strategy.startswith('best_first'):
+        shared_lowest_bound = multiprocessing.Value('d', INF)
+
+    best_tour, best_cost, _ = solver.result()
+    iterations = solver.iterations
+    stopped_by = None
+    lower_bound = INF
+    # every process has its own queue
+    peak_queue = solver.candidate_nodes.peak_size
+    pruned = solver.pruned
+    transpositions = solver.transposition_count
+
+    shared_iterations = multiprocessing.Value('l', iterations)
+    shared_stop = multiprocessing.Value('b', False)
+
+    # the results (or the errors) of the subtrees, and
+    # the bounds of the vertices whose subtrees are being
+    # searched (by the number they were given under)
+    results = queue.Queue()
+    running = {}
+
+    with multiprocessing.Pool(
+            jobs, init_worker,
+            (C, solver_options, shared_best_cost, shared_iterations,
+             shared_lowest_bound, shared_stop, solver.deadline)) as pool:
+        while True:
+            # No tour is cheaper than the lowest bound of the
+            # waiting vertices and the subtrees being searched.
+            # If one of them can still give a better tour and
+            # the gap is reached, the running processes hand
+            # their vertices back.
+            open_bound = min(list(running.values()) +
+                             [min(waiting)[0] if waiting else INF])
+            if solver.gap is not None and best_cost is not None and \
+                    open_bound < shared_best_cost.value and \
+                    not stopped_by and best_cost <= (1 + solver.gap) * min(
+                        lower_bound, open_bound + solver.forced_cost):
+                stopped_by = 'gap'
+                shared_stop.value = True
+
+            # give the most promising vertices to
+            # the idle processes
+            while waiting and len(running) < jobs and not stopped_by:
+                bound, key, paths = heapq.heappop(waiting)
+                # a better tour has been found already
+                if bound >= shared_best_cost.value:
+                    continue
+                pool.apply_async(
+                    solve_subproblem, (paths,),
+                    callback=lambda result, key=key: results.put(
+                        (key, result)),
+                    error_callback=lambda error, key=key: results.put(
+                        (key, error)))
+                running[key] = bound
+
+            if shared_lowest_bound is not None:
+                shared_lowest_bound.value = waiting[0][0] if waiting else INF
+
+            if not running:
+                break
 
-    C_prime, sum_subtrahends = simplify(C_prime)
+            key, result = results.get()
+            subtree_bound = running.pop(key)
+            if isinstance(result, BaseException):
+                raise result
+
+            tour, cost, stats, open_nodes = result
+            iterations += stats['iterations']
+            if tour and (best_cost is None or cost < best_cost):
+                best_tour = tour
+                best_cost = cost
+
+            # every subtree has its own lower bound
+            if stats['stopped_by'] in SHARED_LIMITS:
+                stopped_by = stopped_by or stats['stopped_by']
+            if stats['lower_bound'] is not None:
+                lower_bound = min(lower_bound, stats['lower_bound'])
+            peak_queue = max(peak_queue, stats['peak_queue'])
+            pruned += stats['pruned']
+            transpositions += stats['transpositions']
+
+            # The vertices handed back wait for a process again.
+            # No tour of the subtree is cheaper than its vertex,
+            # even if the bounds the process rebuilt are lower.
+            for paths, bound in open_nodes:
+                heapq.heappush(waiting, (max(bound, subtree_bound),
+                                         next(counter), paths))
+
+    # the vertices left waiting by a limit or the gap
+    if waiting:
+        lower_bound = min(lower_bound,
+                          min(waiting)[0] + solver.forced_cost)
+    if best_cost is not None:
+        lower_bound = min(lower_bound, best_cost)
+
+    stats = {'method': 'branch_and_bound',
+             'iterations': iterations,
+             'time': time.time() - start_time,
+             'stopped_by': stopped_by,
+             'lower_bound': None if lower_bound == INF else lower_bound,
+             'gap': find_gap(best_cost, lower_bound),
+             'peak_queue': peak_queue,
+             'pruned': pruned,
+             'transpositions': transpositions}
+
+    return best_tour, best_cost, stats
 
-    # adjust bound(X) value
-    X.bound = cost_included_paths + sum_subtrahends
 
-    return False
+# ==============================================================
+# Test runs
+# ==============================================================
+
+# Solve the random matrix of the given test run (counting
+# from 1) and return the statistics of the search. Every
+# test run generates its matrix from its own random seed,
+# so test runs can be done in any order and in separate
+# processes.
+def do_test_run(test_run, random_seed, cities, weights, arcs, symmetric,
+                solver_options):
+    random.seed(random_seed + test_run - 1)
+    C = generate_new_matrix(cities, weights, arcs, symmetric)
+
+    best_tour, best_cost, stats = TSPSolver(**solver_options).solve(C)
+    return stats
+
+
+# Sum up the statistics of the test runs (see do_test_run).
+# The runs which did not branch at all (solved by dynamic
+# programming or by preprocessing, or stopped by a limit
+# right away) are left out of the time per iteration.
+def summarize_test_runs(all_stats):
+    total_time = 0
+    total_time_per_iteration = 0
+    total_iterations = 0
+    test_runs = 0
+    branched_runs = 0
+    dp_runs = 0
+    stopped_runs = 0
+    peak_queue = 0
+
+    for stats in all_stats:
+        test_runs += 1
+        total_time += stats['time']
+        total_iterations += stats['iterations']
+        if stats['iterations']:
+            total_time_per_iteration += stats['time'] / stats['iterations']
+            branched_runs += 1
+        if stats['method'] == 'dp':
+            dp_runs += 1
+        if stats['stopped_by']:
+            stopped_runs += 1
+        peak_queue = max(peak_queue, stats['peak_queue'])
+
+    return {'time': total_time / test_runs,
+            'time_per_iteration':
+                total_time_per_iteration / branched_runs
+                if branched_runs else 0,
+            'iterations': total_iterations / test_runs,
+            'dp_runs': dp_runs,
+            'stopped_runs': stopped_runs,
+            'peak_queue': peak_queue}
 
 
 # ==============================================================
@@ -862,10 +3210,9 @@ def block_11():
 # ==============================================================
 if __name__ == '__main__':
     # --------------------------------------------------
-    # Initialize global variables (part 1/2)
+    # Initialize variables
     # --------------------------------------------------
 
-    DEBUG = False
     C = []
     names = {}
 
@@ -877,11 +3224,24 @@ if __name__ == '__main__':
                     '(TSP) using branch and bound algorithm ###',
         usage='\n    tsp_branch_bound.py input_file [-o OUTPUT_FILE] [-d/-s]\n'
               '\nusage for randomized input:'
-              '\n    tsp_branch_bound.py -c CITIES [-a ARCS] [-w MIN MAX] '
-              '[-r RANDOM_SEED] [-o OUTPUT_FILE] [-d/-s]\n'
+              '\n    tsp_branch_bound.py -c CITIES [-a ARCS | -y] '
+              '[-w MIN MAX] [-r RANDOM_SEED] [-o OUTPUT_FILE] [-d/-s]\n'
               '\nusage for executing many test runs:'
-              '\n    tsp_branch_bound.py -c CITIES [-a ARCS] [-w MIN MAX] '
-              '[-r RANDOM_SEED] [-o OUTPUT_FILE] [-t TEST_RUNS] [-s]\n'
+              '\n    tsp_branch_bound.py -c CITIES [-a ARCS | -y] '
+              '[-w MIN MAX] [-r RANDOM_SEED] [-o OUTPUT_FILE] '
+              '[-t TEST_RUNS] [-s]\n'
+              '\nusage for resuming a saved search:'
+              '\n    tsp_branch_bound.py --resume FILE [-o OUTPUT_FILE] [-s]\n'
+              '\nsearch options (for any of the above):'
+              '\n    [-b {reduction,assignment,one_tree}] '
+              '[-e {auto,list,numpy}] [-j JOBS]'
+              '\n    [--dp_threshold DP_THRESHOLD] [--heuristic {auto,on,off}]'
+              '\n    [--no_preprocessing] [--transpositions]'
+              '\n    [--strategy STRATEGY] [--queue_limit N]'
+              '\n    [--branching BRANCHING] [--strong_candidates K]'
+              '\n    [-m SNAPSHOT_MEMORY] [-k SNAPSHOT_DEPTH]'
+              '\n    [--time_limit SECONDS] [--node_limit N] [--gap EPS]'
+              '\n    [--checkpoint FILE] [--checkpoint_interval SECONDS]\n'
               '\nTry tsp_branch_bound.py --help for more information.')
 
     parser.add_argument('-d', '--debug',
@@ -913,6 +3273,12 @@ if __name__ == '__main__':
                              'values of weights. Minimum value is 1. '
                              'Default interval: 1 10')
 
+    parser.add_argument('-y', '--symmetric',
+                        action='store_true',
+                        help='[randomize input]: generate a symmetric matrix '
+                             '(path i -> j costs the same as j -> i). Can not '
+                             'be used with -a')
+
     parser.add_argument('-r', '--random_seed',
                         type=int,
                         help='[randomize input]: set random seed for '
@@ -932,9 +3298,163 @@ if __name__ == '__main__':
                         help='set non-verbose output '
                              '(prints only time passed in seconds)')
 
+    parser.add_argument('-m', '--snapshot_memory',
+                        type=float,
+                        default=0,
+                        help='memory (in megabytes) for saving the matrices '
+                             'of candidate vertices, so that they do not have '
+                             'to be rebuilt from the root. Default value: 0 '
+                             '(no matrices are saved)')
+
+    parser.add_argument('-k', '--snapshot_depth',
+                        type=int,
+                        default=0,
+                        help='save the matrix of every K-th level of the '
+                             'search tree, so that vertices are rebuilt from '
+                             'the closest saved ancestor instead of the root. '
+                             'Default value: 0 (always rebuild from the root)')
+
+    parser.add_argument('-b', '--bound',
+                        choices=['reduction', 'assignment', 'one_tree'],
+                        default='reduction',
+                        help='lower bound of the vertices: the reduction of '
+                             'rows and columns, the assignment problem '
+                             '(stronger, but slower to find), or the 1-tree '
+                             'bound of Held and Karp together with the '
+                             'assignment problem (for symmetric matrices '
+                             'only). Default value: reduction')
+
+    parser.add_argument('--dp_threshold',
+                        type=int,
+                        default=DP_THRESHOLD,
+                        help='solve matrices of at most this many cities by '
+                             'dynamic programming instead of branch and '
+                             'bound (not in debug mode). Default value: '
+                             f'{DP_THRESHOLD} (0 means never, at most '
+                             f'{DP_MAX_CITIES})')
+
+    parser.add_argument('--time_limit',
+                        type=float,
+                        metavar='SECONDS',
+                        help='stop the search after this many seconds and '
+                             'print the best tour found so far, with the '
+                             'lower bound and the gap')
+
+    parser.add_argument('--node_limit',
+                        type=int,
+                        metavar='N',
+                        help='stop the search after N iterations (of all the '
+                             'processes) and print the best tour found so '
+                             'far, with the lower bound and the gap')
+
+    parser.add_argument('--gap',
+                        type=float,
+                        metavar='EPS',
+                        help='stop the search as soon as the best tour found '
+                             'so far costs at most (1 + EPS) times the lowest '
+                             'bound of the vertices left, e.g. 0.01 for 1%%')
+
+    parser.add_argument('--strategy',
+                        choices=STRATEGIES,
+                        default='best_first',
+                        help='how the next vertex is chosen: the one with '
+                             'the lowest bound (best_first), the deepest '
+                             'one among those (best_first_depth), the child '
+                             'of the current vertex while it can give a '
+                             'better tour (depth_first), or best_first '
+                             'switching to depth_first while there are more '
+                             'than --queue_limit candidate vertices '
+                             '(hybrid). Default value: best_first')
+
+    parser.add_argument('--queue_limit',
+                        type=int,
+                        default=QUEUE_LIMIT,
+                        metavar='N',
+                        help='number of candidate vertices (each keeps its '
+                             'branch of the tree in memory) above which the '
+                             'hybrid strategy searches depth first. Default '
+                             f'value: {QUEUE_LIMIT}')
+
+    parser.add_argument('--branching',
+                        choices=BRANCHING_RULES,
+                        default='first',
+                        help='which of the paths with the largest change '
+                             'of the bound is branched on: the first one '
+                             'found, the cheapest one (cost), the one making '
+                             'the longest fragment of the tour (fragment), '
+                             'or, trying the --strong_candidates best paths, '
+                             'the one whose vertices get the highest bounds '
+                             '(strong). Default value: first')
+
+    parser.add_argument('--strong_candidates',
+                        type=int,
+                        default=STRONG_CANDIDATES,
+                        metavar='K',
+                        help='number of paths tried by the strong branching '
+                             f'rule. Default value: {STRONG_CANDIDATES}')
+
+    parser.add_argument('--transpositions',
+                        action='store_true',
+                        help='drop the vertices which lead to the same '
+                             'problem as a vertex found before (the same '
+                             'fragments of the tour and the same excluded '
+                             'paths left), but cost more so far. Helps when '
+                             'many paths have the same weight (narrow '
+                             '-w ranges), takes memory for every vertex')
+
+    parser.add_argument('--checkpoint',
+                        metavar='FILE',
+                        help='save the state of the search to FILE every '
+                             '--checkpoint_interval seconds and when the '
+                             'search stops, so that it can be resumed later '
+                             '(see --resume)')
+
+    parser.add_argument('--checkpoint_interval',
+                        type=float,
+                        default=CHECKPOINT_INTERVAL,
+                        metavar='SECONDS',
+                        help='number of seconds between checkpoints. '
+                             f'Default value: {CHECKPOINT_INTERVAL}')
+
+    parser.add_argument('--resume',
+                        metavar='FILE',
+                        help='continue the search saved to FILE (see '
+                             '--checkpoint). The matrix is taken from '
+                             'the file as well')
+
+    parser.add_argument('--heuristic',
+                        choices=['auto', 'on', 'off'],
+                        default='auto',
+                        help='look for a good tour with heuristics '
+                             '(nearest neighbour and local search) before '
+                             'branching. Default value is auto: only if '
+                             'the search may be stopped early (see '
+                             '--time_limit, --node_limit and --gap)')
+
+    parser.add_argument('--no_preprocessing',
+                        action='store_true',
+                        help='do not look for the paths which every tour '
+                             'takes (the only ones out of or into a city, '
+                             'see -a) before branching. With them, the '
+                             'matrix is contracted to a smaller one')
+
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=1,
+                        help='number of processes. Test runs are spread '
+                             'over them, a single matrix is solved by '
+                             'parallel branch and bound. Default value: 1')
+
+    parser.add_argument('-e', '--engine',
+                        choices=['auto', 'list', 'numpy'],
+                        default='auto',
+                        help='matrix engine: Python lists or NumPy arrays. '
+                             'Default value is auto: NumPy for matrices '
+                             f'of size {ARRAY_ENGINE_MIN_SIZE} or more '
+                             '(if NumPy is installed), lists otherwise')
+
     args = parser.parse_args()
 
-    DEBUG = args.debug
     arg_count = len(sys.argv)
 
     if arg_count == 1 or args.debug and arg_count == 2:
@@ -943,7 +3463,26 @@ if __name__ == '__main__':
 
     INPUT_FILE = args.input_file
 
-    if INPUT_FILE:
+    if args.resume:
+        if INPUT_FILE:
+            print("tsp_branch_bound.py: error: argument --resume: "
+                  "can not be used when input file is specified")
+            sys.exit()
+        elif args.cities or args.weights or args.arcs or args.symmetric \
+                or args.random_seed:
+            print("tsp_branch_bound.py: error: argument --resume: "
+                  "can not be used with -c, -w, -a, -y or -r, the "
+                  "matrix is taken from the checkpoint")
+            sys.exit()
+        elif args.test_runs:
+            print("tsp_branch_bound.py: error: argument --resume: "
+                  "can not be used with -t/--test_runs")
+            sys.exit()
+        elif not os.path.isfile(args.resume):
+            print("tsp_branch_bound.py: error: argument --resume: "
+                  f"no such file: {args.resume}")
+            sys.exit()
+    elif INPUT_FILE:
         if args.cities:
             print("tsp_branch_bound.py: error: argument -c/--cities: "
                   "can not be used when input file is specified")
@@ -962,6 +3501,10 @@ if __name__ == '__main__':
             print("tsp_branch_bound.py: error: argument -a/--arcs: "
                   "can not be used when input file is specified")
             sys.exit()
+        elif args.symmetric:
+            print("tsp_branch_bound.py: error: argument -y/--symmetric: "
+                  "can not be used when input file is specified")
+            sys.exit()
     else:
         if not args.cities:
             print("tsp_branch_bound.py: error: argument -c/--cities: "
@@ -992,6 +3535,15 @@ if __name__ == '__main__':
                       f"Minimum value: {args.cities}, maximum: {args.cities * (args.cities - 1)}. "
                       f"These values depend on the specified number of cities")
                 sys.exit()
+            elif args.symmetric:
+                print("tsp_branch_bound.py: error: argument -y/--symmetric: "
+                      "can not be used with -a/--arcs")
+                sys.exit()
+
+        if args.bound == 'one_tree' and not args.symmetric:
+            print("tsp_branch_bound.py: error: argument -b/--bound: "
+                  "one_tree needs a symmetric matrix (see -y/--symmetric)")
+            sys.exit()
 
     if args.debug:
         if args.silent:
@@ -1002,13 +3554,86 @@ if __name__ == '__main__':
             print("tsp_branch_bound.py: error: argument -t/--test_runs: "
                   "can not be used with debug mode")
             sys.exit()
+        elif args.jobs > 1:
+            print("tsp_branch_bound.py: error: argument -j/--jobs: "
+                  "can not be used with debug mode")
+            sys.exit()
+
+    if args.time_limit is not None and args.time_limit <= 0:
+        print("tsp_branch_bound.py: error: argument --time_limit: "
+              "the number must be positive")
+        sys.exit()
+
+    if args.node_limit is not None and args.node_limit < 1:
+        print("tsp_branch_bound.py: error: argument --node_limit: "
+              "the minimum number is 1")
+        sys.exit()
+
+    if args.gap is not None and args.gap < 0:
+        print("tsp_branch_bound.py: error: argument --gap: "
+              "the number cannot be negative")
+        sys.exit()
+
+    if args.checkpoint or args.resume:
+        option = '--checkpoint' if args.checkpoint else '--resume'
+        if args.test_runs:
+            print(f"tsp_branch_bound.py: error: argument {option}: "
+                  f"can not be used with -t/--test_runs")
+            sys.exit()
+        elif args.jobs > 1:
+            print(f"tsp_branch_bound.py: error: argument {option}: "
+                  f"can not be used with -j/--jobs")
+            sys.exit()
+
+    if args.strong_candidates < 1:
+        print("tsp_branch_bound.py: error: argument --strong_candidates: "
+              "the minimum number is 1")
+        sys.exit()
+
+    if args.queue_limit < 0:
+        print("tsp_branch_bound.py: error: argument --queue_limit: "
+              "the number cannot be negative")
+        sys.exit()
+
+    if args.checkpoint_interval <= 0:
+        print("tsp_branch_bound.py: error: argument --checkpoint_interval: "
+              "the number must be positive")
+        sys.exit()
+
+    if args.dp_threshold < 0:
+        print("tsp_branch_bound.py: error: argument --dp_threshold: "
+              "the number cannot be negative")
+        sys.exit()
+    elif args.dp_threshold > DP_MAX_CITIES:
+        print("tsp_branch_bound.py: error: argument --dp_threshold: "
+              f"the maximum number is {DP_MAX_CITIES}")
+        sys.exit()
+
+    if args.jobs < 1:
+        print("tsp_branch_bound.py: error: argument -j/--jobs: "
+              "the minimum number is 1")
+        sys.exit()
+
+    if args.engine == 'numpy' and np is None:
+        print("tsp_branch_bound.py: error: argument -e/--engine: "
+              "NumPy is not installed")
+        sys.exit()
 
     if args.output_file:
         sys.stdout = open(args.output_file, 'a')
 
     random_seed = 1
 
-    if not args.input_file:
+    if args.resume:
+        checkpoint = read_checkpoint(args.resume)
+        C = checkpoint['C']
+
+        if args.bound == 'one_tree' and not is_symmetric(C):
+            print("tsp_branch_bound.py: error: argument -b/--bound: "
+                  "one_tree needs a symmetric matrix")
+            sys.exit()
+
+    elif not args.input_file:
         if args.random_seed:
             random_seed = args.random_seed
         random.seed(random_seed)
@@ -1021,7 +3646,7 @@ if __name__ == '__main__':
             w_n = args.weights[1]
 
         weights = [w_1, w_n]
-        C = generate_new_matrix(cities, weights, args.arcs)
+        C = generate_new_matrix(cities, weights, args.arcs, args.symmetric)
 
     else:
         # --------------------------------------------------
@@ -1085,211 +3710,109 @@ if __name__ == '__main__':
 
                 lines = lines[matrix_size:]
 
-    # --------------------------------------------------
-    # Initialize global variables (part 2/2)
-    # --------------------------------------------------
-
-    # DEBUG - already initialized in (part 1/2)
-    #         and then defined by -d flag
-
-    # -----------------------------
-    # Matrix related
-    # -----------------------------
-    # C - already initialized in (part 1/2) and then defined
-    #     either from input file or by randomly generating it
-    C_prime = None
-
-    row_map = []
-    col_map = []
-
-    i_from = None
-    j_to = None
-    max_Dij = None
-
-    # -----------------------------
-    # Tree related
-    # -----------------------------
-    X = None
-    Y = None
-    Y_bar = None
-    candidate_nodes = CandidateNodes()
-
-    # -----------------------------
-    # Tour related
-    # -----------------------------
-    current_tour = []
-    best_tour = []
-    best_cost = None
-    # names - already initialized in (part 1/2) and then
-    #         either defined from input file or left empty
-
-    # -----------------------------
-    # Iteration counter
-    # -----------------------------
-    iterations = 0
+        if args.bound == 'one_tree' and not is_symmetric(C):
+            print("tsp_branch_bound.py: error: argument -b/--bound: "
+                  "one_tree needs a symmetric matrix")
+            sys.exit()
 
     # --------------------------------------------------
-    # Main loop (DEBUG mode)
+    # Solver options
     # --------------------------------------------------
 
-    if DEBUG:
-        start_time = time.time()
-
-        debug_block_1()
-        debug_block_2()
-
-        while True:
-            iterations += 1
-            if not debug_block_3():
-                Y = candidate_nodes.pop()
-                X = candidate_nodes.pop()
-                debug_block_11()
-                continue
-
-            debug_block_4()
-            debug_block_5()
-
-            if debug_block_6():
-                debug_block_7()
-                debug_block_8()
-
-            debug_block_9()
-
-            if not debug_block_10():
-                debug_block_11()
-            else:
-                break
-
-        end_time = time.time()
-
-        check_tour(best_tour)
-        print_solution()
-        print(f'--------- {iterations} iterations -----------')
-        print(f'--- {end_time - start_time} seconds ---')
-        print(60 * '-')
+    solver_options = {
+        'engine': args.engine,
+        'snapshot_memory': int(args.snapshot_memory * 2 ** 20),
+        'snapshot_depth': args.snapshot_depth,
+        'heuristic': {'auto': None, 'on': True, 'off': False}[
+            args.heuristic],
+        'bound': args.bound,
+        'dp_threshold': args.dp_threshold,
+        'time_limit': args.time_limit,
+        'node_limit': args.node_limit,
+        'gap': args.gap,
+        'checkpoint_file': args.checkpoint,
+        'checkpoint_interval': args.checkpoint_interval,
+        'strategy': args.strategy,
+        'queue_limit': args.queue_limit,
+        'branching': args.branching,
+        'strong_candidates': args.strong_candidates,
+        'transpositions': args.transpositions,
+        'preprocessing': not args.no_preprocessing,
+        'debug': args.debug,
+    }
 
     # --------------------------------------------------
-    # Main loop (standard mode)
+    # Standard (and DEBUG) mode
     # --------------------------------------------------
-    elif not args.test_runs:
-        start_time = time.time()
-
-        block_1()
-        block_2()
-
-        while True:
-            iterations += 1
-            if not block_3():
-                Y = candidate_nodes.pop()
-                X = candidate_nodes.pop()
-                block_11()
-                continue
 
-            block_4()
-            block_5()
-
-            if block_6():
-                block_7()
-                block_8()
-
-            block_9()
-
-            if not block_10():
-                block_11()
-            else:
-                break
-
-        end_time = time.time()
+    if not args.test_runs:
+        if args.jobs > 1:
+            best_tour, best_cost, stats = \
+                solve_parallel(C, args.jobs, solver_options)
+        elif args.resume:
+            solver = TSPSolver(**solver_options)
+            if solver.resume(checkpoint):
+                solver.search()
+            best_tour, best_cost, stats = solver.result()
+        else:
+            solver = TSPSolver(**solver_options)
+            best_tour, best_cost, stats = solver.solve(C)
 
         if args.silent:
-            print(end_time - start_time)
+            print(stats['time'])
         else:
-            check_tour(best_tour)
-            print_solution()
-            print(f'--------- {iterations} iterations -----------')
-            print(f'--- {end_time - start_time} seconds ---')
+            if best_tour:
+                print_solution(best_tour, best_cost, names)
+            else:
+                print('No tour has been found\n')
+
+            if stats['stopped_by']:
+                limit = stats['stopped_by'].replace('_', ' ')
+                print(f'The search was stopped by the {limit}, '
+                      f'before the best tour was proved to be found')
+                print(f'Lower bound = {stats["lower_bound"]}')
+                if stats['gap'] is not None:
+                    print(f'Gap = {stats["gap"]:.2%}')
+                print()
+
+            if stats['method'] == 'dp':
+                print('--------- solved by dynamic programming -----------')
+            else:
+                print(f'--------- {stats["iterations"]} iterations '
+                      f'-----------')
+                print(f'--- {stats["peak_queue"]} candidate vertices at '
+                      f'most, {stats["pruned"]} pruned ---')
+            if args.transpositions:
+                print(f'--- {stats["transpositions"]} transpositions '
+                      f'dropped ---')
+            print(f'--- {stats["time"]} seconds ---')
             print(60 * '-')
 
     # --------------------------------------------------
-    # Main loop (testing mode)
+    # Testing mode
     # --------------------------------------------------
     else:
-        total_time = 0
-        total_time_per_iteration = 0
-        total_iterations = 0
-
-        for test_run in range(1, args.test_runs + 1):
-
-            start_time = time.time()
-
-            block_1()
-            block_2()
-
-            while True:
-                iterations += 1
-                if not block_3():
-                    Y = candidate_nodes.pop()
-                    X = candidate_nodes.pop()
-                    block_11()
-                    continue
-
-                block_4()
-                block_5()
-
-                if block_6():
-                    block_7()
-                    block_8()
-
-                block_9()
-
-                if not block_10():
-                    block_11()
-                else:
-                    break
-
-            end_time = time.time()
-
-            time_taken = end_time - start_time
-            time_per_iteration = time_taken / iterations
-
-            total_time += time_taken
-            total_time_per_iteration += time_per_iteration
-            total_iterations += iterations
-
-            # --------------------------------------------------
-            # Create new input matrix with different
-            # random seed for each new test run
-            # --------------------------------------------------
-
-            random.seed(random_seed + test_run)
-            C = generate_new_matrix(args.cities, weights, args.arcs)
-
-            # --------------------------------------------------
-            # Reinitialize global variables
-            # --------------------------------------------------
-            C_prime = None
-
-            row_map = []
-            col_map = []
-
-            i_from = None
-            j_to = None
-            max_Dij = None
-
-            X = None
-            Y = None
-            Y_bar = None
-            candidate_nodes = CandidateNodes()
-
-            current_tour = []
-            best_tour = []
-            best_cost = None
-
-            iterations = 0
+        # every test run creates a new input matrix
+        # with a different random seed
+        test_run = functools.partial(
+            do_test_run, random_seed=random_seed, cities=args.cities,
+            weights=weights, arcs=args.arcs, symmetric=args.symmetric,
+            solver_options=solver_options)
+        test_runs = range(1, args.test_runs + 1)
+
+        if args.jobs > 1:
+            with multiprocessing.Pool(args.jobs) as pool:
+                all_stats = pool.map(test_run, test_runs)
+        else:
+            all_stats = map(test_run, test_runs)
 
-        avg_time = total_time / args.test_runs
-        avg_time_per_iteration = total_time_per_iteration / args.test_runs
-        avg_iterations = total_iterations / args.test_runs
+        summary = summarize_test_runs(all_stats)
+        avg_time = summary['time']
+        avg_time_per_iteration = summary['time_per_iteration']
+        avg_iterations = summary['iterations']
+        dp_runs = summary['dp_runs']
+        stopped_runs = summary['stopped_runs']
+        peak_queue = summary['peak_queue']
 
         if args.silent:
             print(f'{avg_time}, {avg_time_per_iteration}, {avg_iterations}')
@@ -1303,7 +3826,13 @@ if __name__ == '__main__':
             print(f'Total time (avg): {avg_time}s\n'
                   f'Time per iteration (avg): {avg_time_per_iteration}s\n'
                   f'Iterations in one test run (avg): {avg_iterations}\n'
+                  f'Candidate vertices in one test run (max): {peak_queue}\n'
                   f'Total number of test runs: {args.test_runs}\n'
                   f'Random seeds of the test runs (interval): '
-                  f'{args.random_seed}-{args.random_seed + args.test_runs - 1}')
+                  f'{random_seed}-{random_seed + args.test_runs - 1}')
+            if dp_runs:
+                print(f'Test runs solved by dynamic programming '
+                      f'(no iterations): {dp_runs}')
+            if stopped_runs:
+                print(f'Test runs stopped by a limit: {stopped_runs}')
             print('-------------------------------------------------')